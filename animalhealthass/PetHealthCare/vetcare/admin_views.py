@@ -0,0 +1,15 @@
+from flask_admin.contrib.sqla import ModelView
+
+
+# Drops cached copies of a user as soon as an admin edits or deletes it, so
+# the change takes effect on that user's next request.
+class UserAdminView(ModelView):
+    def __init__(self, model, session, user_cache, **kwargs):
+        self.user_cache = user_cache
+        super().__init__(model, session, **kwargs)
+
+    def after_model_change(self, form, model, is_created):
+        self.user_cache.invalidate(model.id)
+
+    def after_model_delete(self, model):
+        self.user_cache.invalidate(model.id)
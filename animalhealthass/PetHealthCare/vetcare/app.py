@@ -1,95 +1,74 @@
-from flask import Flask, render_template, url_for, redirect, flash, request
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import UserMixin, login_user, LoginManager, login_required, logout_user, current_user
-from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField
-from wtforms.validators import InputRequired, Email, Length, EqualTo, ValidationError
-from flask_bcrypt import Bcrypt
-from flask_admin import Admin
-from flask_admin.contrib.sqla import ModelView
-from flask_cors import CORS
-import numpy as np
-from flask import request, jsonify
-
-from utils import load_and_prepare_data
-from random_forest import random_forest, bagging_predict
-
-# --------------------- App Config ---------------------
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SECRET_KEY'] = 'thisisasecretkey'
-
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
-
-# --------------------- User Model ---------------------
-
-
-class User(db.Model, UserMixin):
-    __tablename__ = 'users'
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(150), nullable=False, unique=True)
-    password = db.Column(db.String(100), nullable=False)
+import io
+import json
+import os
+import threading
+import time
+from itertools import chain
 
+from flask import Flask, render_template, url_for, redirect, flash, request
+from flask import jsonify, Response, stream_with_context, g, current_app
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+
+from models import db, init_database, User, Prediction
+from metrics import metrics, profiler
+from model_service import ModelService
+from auth import HasherBusy, PasswordHasher, UserCache
+from history import HistoryWriter
+from scheduler import MicroBatcher
+from http_cache import ResponseCache, compress_response, send_static
+
+# Heavy dependencies (numpy, the model artifact, Flask-Admin, WTForms,
+# bcrypt) are imported on first use or during an explicit warm-up, so a
+# worker can answer lightweight routes like /options as soon as it starts.
+# Importing this module builds no app; create_app gives every app its own
+# model service, user cache and worker pools in app.extensions.
 
 # --------------------- Flask-Login Setup ---------------------
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+def _query_user(user_id):
+    user = User.query.get(user_id)
+    if user is not None:
+        # Detach the loaded row so it can outlive this request's session.
+        db.session.expunge(user)
+    return user
 
 
-# --------------------- Flask-Admin Setup ---------------------
-admin = Admin(app, name='VetCare Admin', template_mode='bootstrap3')
-admin.add_view(ModelView(User, db.session))
+def load_user(user_id):
+    # Every @login_required request loads the user, so loaded users are kept
+    # for USER_CACHE_TTL seconds instead of querying SQLite each time.
+    return current_app.extensions['user_cache'].get(int(user_id), _query_user)
 
-# --------------------- Forms ---------------------
 
+def get_bcrypt():
+    bcrypt = current_app.extensions.get('bcrypt')
+    if bcrypt is None:
+        from flask_bcrypt import Bcrypt
+        bcrypt = current_app.extensions['bcrypt'] = Bcrypt(current_app)
+    return bcrypt
 
-class RegisterForm(FlaskForm):
-    email = StringField(validators=[InputRequired(), Email(), Length(max=150)],
-                        render_kw={"placeholder": "Email"})
-    password = PasswordField(validators=[InputRequired(), Length(min=8, max=100)],
-                             render_kw={"placeholder": "Password"})
-    confirm_password = PasswordField(validators=[InputRequired(), EqualTo('password')],
-                                     render_kw={"placeholder": "Confirm Password"})
-    submit = SubmitField('Register')
 
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError(
-                'Email already registered. Please use a different one.')
+def password_hasher():
+    return current_app.extensions['password_hasher']
 
 
-class LoginForm(FlaskForm):
-    email = StringField(validators=[InputRequired(), Email(), Length(max=150)],
-                        render_kw={"placeholder": "Email"})
-    password = PasswordField(validators=[InputRequired(), Length(min=8, max=100)],
-                             render_kw={"placeholder": "Password"})
-    submit = SubmitField('Login')
+def model_service():
+    return current_app.extensions['model_service']
 
 
-# --------------------- ML Data Preparation ---------------------
-data, encoders = load_and_prepare_data('animal_health_dataset.csv')
-X, y = data[:, :-1], data[:, -1]
-train_data = np.column_stack((X, y))
+def predict_one(model, sample):
+    # Concurrent single-case predictions are batched by the scheduler when
+    # PREDICT_BATCHING is on.
+    batcher = current_app.extensions.get('predict_batcher')
+    if batcher is None:
+        return model.prediction_table.predict(sample)
+    return batcher.predict(model.prediction_table, sample)
 
-# Train the Random Forest
-n_trees = 10
-max_depth = 5
-min_size = 5
-sample_size = 0.8
-trees = random_forest(train_data, X, max_depth, min_size, sample_size, n_trees)
 
-animal_encoder = encoders['Animal']
-gender_encoder = encoders['Gender']
-disease_encoder = encoders['Disease']
+# --------------------- ML Model ---------------------
+# Each app's ModelService loads the saved forest from instance/model,
+# training it only when the artifact is missing or stale (see model_store.py
+# and model_service.py).
 
 medication_mapping = {
     'Parvovirus': {
@@ -139,16 +118,105 @@ medication_mapping = {
     }
 }
 
+OPTIONS = {'animals': ['Cat', 'Dog', 'Rabbit', 'Parrot', 'Hamster'],
+           'genders': ['Male', 'Female']}
+
+
+def build_response_cache(app):
+    # /options, /medication and static/ never change while the process runs,
+    # so their bodies, ETags and compressed variants are built once here.
+    cache = ResponseCache(max_age=app.config['RESPONSE_CACHE_MAX_AGE'],
+                          static_max_age=app.config['STATIC_CACHE_MAX_AGE'],
+                          min_size=app.config['COMPRESS_MIN_SIZE'])
+    cache.add_json(app, ('options',), OPTIONS)
+    for disease, treatment in medication_mapping.items():
+        cache.add_json(app, ('medication', disease), {
+            'treatment': treatment['description'],
+            'medications': treatment['products']
+        })
+    if app.static_folder and os.path.isdir(app.static_folder):
+        cache.load_static(app.static_folder)
+    return cache
+
+
+# --------------------- Request Metrics ---------------------
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('vetcare_request_seconds', time.perf_counter() - started,
+                        route=route, method=request.method)
+        metrics.inc('vetcare_requests_total', route=route,
+                    method=request.method, status=response.status_code)
+    return response
+
+
+# --------------------- Prediction History ---------------------
+
+
+def _symptom_mask(symptoms):
+    return sum(1 << i for i, symptom in enumerate(symptoms) if symptom)
+
+
+def _history_text(value):
+    # animal and gender are raw request values (any JSON value on the
+    # Healthy path), so they are stored as text or NULL.
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _history_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _record_history(source, entries):
+    # entries are (animal, age, gender, symptoms, disease) tuples
+    writer = current_app.extensions.get('history_writer')
+    if writer is None or not current_user.is_authenticated:
+        return
+    user_id, now = current_user.id, time.time()
+    writer.record([{
+        'user_id': user_id,
+        'created_at': now,
+        'source': source,
+        'animal': _history_text(animal),
+        'age': _history_number(age),
+        'gender': _history_text(gender),
+        'symptoms': int(_symptom_mask(symptoms)),
+        'disease': str(disease),
+    } for animal, age, gender, symptoms, disease in entries])
+
+
 # --------------------- Routes ---------------------
+# Views are collected here and attached to each app built by create_app.
+_routes = []
+
 
+def route(rule, **options):
+    def decorator(view_func):
+        _routes.append((rule, view_func, options))
+        return view_func
+    return decorator
 
-@app.route('/')
+
+
+@route('/')
 def home():
     return render_template('home.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
+    from forms import LoginForm
+
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
@@ -156,7 +224,14 @@ def login():
             flash("User not found. Please register first.", "warning")
             return redirect(url_for('register'))
 
-        if bcrypt.check_password_hash(user.password, form.password.data):
+        try:
+            password_ok = password_hasher().check_password_hash(
+                get_bcrypt(), user.password, form.password.data)
+        except HasherBusy:
+            flash("Too many sign-in attempts right now. Please try again shortly.", "warning")
+            return render_template('login.html', form=form), 503
+
+        if password_ok:
             login_user(user)
             flash("Logged in successfully.", "success")
             return redirect(url_for('dashboard'))
@@ -165,12 +240,18 @@ def login():
     return render_template('login.html', form=form)
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
+    from forms import RegisterForm
+
     form = RegisterForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(
-            form.password.data).decode('utf-8')
+        try:
+            hashed_password = password_hasher().generate_password_hash(
+                get_bcrypt(), form.password.data)
+        except HasherBusy:
+            flash("Too many registrations right now. Please try again shortly.", "warning")
+            return render_template('register.html', form=form), 503
         new_user = User(email=form.email.data, password=hashed_password)
         db.session.add(new_user)
         db.session.commit()
@@ -179,68 +260,71 @@ def register():
     return render_template('register.html', form=form)
 
 
-@app.route('/healthcheck', methods=['GET', 'POST'])
+@route('/healthcheck', methods=['GET', 'POST'])
 @login_required
 def healthcheck():
+    model = model_service().get()
+    feature_encoder = model.feature_encoder
     if request.method == 'POST':
         try:
-            animal = request.form.get('animal')
-            age = float(request.form.get('age'))
-            gender = request.form.get('gender')
-
-            def get_symptom(symptom):
-                val = request.form.get(symptom)
-                return int(val) if val else 0
-
-            symptoms = [get_symptom(s) for s in ['fever', 'cough', 'vomiting', 'diarrhea',
-                                                 'lethargy', 'appetite', 'sneezing', 'rash']]
-
-            animal_encoded = animal_encoder.transform([animal])[0]
-            gender_encoded = gender_encoder.transform([gender])[0]
-
-            sample = [animal_encoded, age, gender_encoded] + symptoms
-
-            prediction = bagging_predict(trees, sample)
-            predicted_label = disease_encoder.inverse_transform([int(prediction)])[
-                0]
-
-            animals = list(animal_encoder.classes_)
-            genders = list(gender_encoder.classes_)
-
-            return render_template('healthcheck.html',
-                                   prediction=predicted_label,
-                                   animals=animals,
-                                   genders=genders)
+            with metrics.stage('healthcheck.parse_form'):
+                animal = request.form.get('animal')
+                age = float(request.form.get('age'))
+                gender = request.form.get('gender')
+
+                def get_symptom(symptom):
+                    val = request.form.get(symptom)
+                    return int(val) if val else 0
+
+                symptoms = [get_symptom(s) for s in ['fever', 'cough', 'vomiting', 'diarrhea',
+                                                     'lethargy', 'appetite', 'sneezing', 'rash']]
+
+            with metrics.stage('healthcheck.encode'):
+                sample = feature_encoder.encode(animal, age, gender, symptoms)
+
+            with metrics.stage('healthcheck.predict'):
+                prediction = predict_one(model, sample)
+            with metrics.stage('healthcheck.decode'):
+                predicted_label = feature_encoder.decode(prediction)
+            metrics.inc('vetcare_predictions_total', route='healthcheck')
+            _record_history('healthcheck', [(animal, age, gender, symptoms, predicted_label)])
+
+            with metrics.stage('healthcheck.render'):
+                return render_template('healthcheck.html',
+                                       prediction=predicted_label,
+                                       animals=feature_encoder.animals,
+                                       genders=feature_encoder.genders)
 
         except Exception as e:
             flash(f"Error during prediction: {str(e)}", "danger")
 
-    animals = list(animal_encoder.classes_)
-    genders = list(gender_encoder.classes_)
-    return render_template('healthcheck.html', animals=animals, genders=genders)
+    with metrics.stage('healthcheck.render'):
+        return render_template('healthcheck.html', animals=feature_encoder.animals,
+                               genders=feature_encoder.genders)
 
 
-@app.route('/predict', methods=['POST'])
+@route('/predict', methods=['POST'])
 @login_required
 def predict():
     try:
-        data = request.get_json()
-
-        animal = data.get('animal')
-        age = float(data.get('age'))
-        gender = data.get('gender')
-
-        # Collect symptoms safely with default 0
-        symptoms = [
-            int(data.get('fever', 0)),
-            int(data.get('cough', 0)),
-            int(data.get('vomiting', 0)),
-            int(data.get('diarrhea', 0)),
-            int(data.get('lethargy', 0)),
-            int(data.get('appetite', 0)),
-            int(data.get('sneezing', 0)),
-            int(data.get('rash', 0))
-        ]
+        with metrics.stage('predict.parse_json'):
+            data = request.get_json()
+
+            animal = data.get('animal')
+            age = float(data.get('age'))
+            gender = data.get('gender')
+
+            # Collect symptoms safely with default 0
+            symptoms = [
+                int(data.get('fever', 0)),
+                int(data.get('cough', 0)),
+                int(data.get('vomiting', 0)),
+                int(data.get('diarrhea', 0)),
+                int(data.get('lethargy', 0)),
+                int(data.get('appetite', 0)),
+                int(data.get('sneezing', 0)),
+                int(data.get('rash', 0))
+            ]
 
         # Check for Healthy (all symptoms are 0)
         if all(symptom == 0 for symptom in symptoms):
@@ -251,36 +335,140 @@ def predict():
             }
         else:
             # Encode categorical features
-            animal_encoded = animal_encoder.transform([animal])[0]
-            gender_encoded = gender_encoder.transform([gender])[0]
-
-            # Combine all features for prediction
-            sample = [animal_encoded, age, gender_encoded] + symptoms
+            model = model_service().get()
+            feature_encoder = model.feature_encoder
+            with metrics.stage('predict.encode'):
+                sample = feature_encoder.encode(animal, age, gender, symptoms)
 
             # Predict using the trained Random Forest
-            prediction = bagging_predict(trees, sample)
-            predicted_label = disease_encoder.inverse_transform([int(prediction)])[0]
+            with metrics.stage('predict.predict'):
+                prediction = predict_one(model, sample)
+            with metrics.stage('predict.decode'):
+                predicted_label = feature_encoder.decode(prediction)
 
             # Fetch medication info from the mapping (safe fallback)
-            medication_info = medication_mapping.get(predicted_label, {
-                'description': 'No medication information available.',
-                'products': []
-            })
+            with metrics.stage('predict.medication_lookup'):
+                medication_info = medication_mapping.get(predicted_label, {
+                    'description': 'No medication information available.',
+                    'products': []
+                })
+        metrics.inc('vetcare_predictions_total', route='predict')
+        _record_history('predict', [(animal, age, gender, symptoms, predicted_label)])
 
         # Return the response as JSON
-        return jsonify({
-            'disease': predicted_label,
-            'treatment_description': medication_info['description'],
-            'medications': medication_info['products']
-        })
+        with metrics.stage('predict.serialize'):
+            return jsonify({
+                'disease': predicted_label,
+                'treatment_description': medication_info['description'],
+                'medications': medication_info['products']
+            })
 
     except Exception as e:
         return jsonify({'error': str(e)})
 
 
+# --------------------- Batch Prediction ---------------------
+# Parsing and scoring are shared with main.py's batch mode (see
+# batch_scoring.py), so both accept the same fields and spellings.
+BATCH_CHUNK_SIZE = 1000
+BATCH_STREAM_THRESHOLD = 1000
+NO_MEDICATION_INFO = {
+    'description': 'No medication information available.',
+    'products': []
+}
+
+
+def _batch_scorer(model):
+    from batch_scoring import BatchScorer
+
+    return BatchScorer(model.feature_encoder, model.prediction_table, medication_mapping,
+                       no_medication_info=NO_MEDICATION_INFO)
+
+
+def _score_chunk(scorer, chunk):
+    # Returns (columns, labels, messages) and records history for every
+    # row that got a diagnosis.
+    from batch_scoring import chunk_columns
+
+    columns, n_rows, errors = chunk_columns(chunk)
+    ages, symptoms, messages = scorer.parse_columns(columns, n_rows, errors)
+    with metrics.stage('predict_batch.predict'):
+        labels = scorer.predict_columns(columns, ages, symptoms, messages)
+    metrics.inc('vetcare_predictions_total', int((labels >= 0).sum()), route='predict_batch')
+
+    missing = [None] * n_rows
+    animals, genders = columns.get('animal', missing), columns.get('gender', missing)
+    _record_history('batch', [
+        (animals[i], ages[i], genders[i], symptoms[i], scorer.results[label]['disease'])
+        for i, label in enumerate(labels.tolist()) if label in scorer.results])
+    return columns, labels, messages
+
+
+def _batch_chunks():
+    # Chunks of (format, CSV header, lines or parsed JSON cases) as
+    # batch_scoring.chunk_columns expects them.
+    from batch_scoring import read_chunks
+
+    # utf-8-sig drops the byte order mark spreadsheet exports put before the
+    # header. Uploads are decoded lazily, so a bad byte only raises
+    # UnicodeDecodeError once the chunks are read.
+    upload = request.files.get('file')
+    if upload is not None:
+        return read_chunks(io.TextIOWrapper(upload.stream, encoding='utf-8-sig'),
+                           BATCH_CHUNK_SIZE, 'csv')
+    if request.mimetype == 'text/csv':
+        return read_chunks(io.StringIO(request.get_data().decode('utf-8-sig')),
+                           BATCH_CHUNK_SIZE, 'csv')
+    cases = request.get_json()
+    if isinstance(cases, dict):
+        cases = cases.get('cases')
+    if not isinstance(cases, list):
+        raise ValueError('Expected a JSON array of cases or a CSV upload.')
+    return (('records', None, cases[start:start + BATCH_CHUNK_SIZE])
+            for start in range(0, len(cases), BATCH_CHUNK_SIZE))
+
+
+@route('/predict/batch', methods=['POST'])
+@login_required
+def predict_batch():
+    head, n_rows = [], 0
+    try:
+        chunks = iter(_batch_chunks())
+        for chunk in chunks:
+            head.append(chunk)
+            n_rows += len(chunk[2])
+            if n_rows > BATCH_STREAM_THRESHOLD:
+                break
+    except UnicodeDecodeError:
+        return jsonify({'error': 'CSV uploads must be UTF-8 encoded.'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    wants_stream = (request.args.get('stream') == '1' or
+                    request.accept_mimetypes.best == 'application/x-ndjson')
+    scorer = _batch_scorer(model_service().get())
+    if n_rows <= BATCH_STREAM_THRESHOLD and not wants_stream:
+        results = []
+        for chunk in head:
+            columns, labels, messages = _score_chunk(scorer, chunk)
+            results.extend(scorer.result_dicts(labels, messages, columns.get('id')))
+        return jsonify(results)
+
+    # Large batches are scored chunk by chunk and written out as NDJSON, so
+    # neither the parsed upload nor the response is held in memory at once.
+    # The status line has already gone out by the time a later chunk fails
+    # to decode, so the error ends the stream as its last line instead.
+    def generate():
+        try:
+            for chunk in chain(head, chunks):
+                columns, labels, messages = _score_chunk(scorer, chunk)
+                yield scorer.render(labels, messages, columns.get('id'))
+        except UnicodeDecodeError:
+            yield json.dumps({'error': 'CSV uploads must be UTF-8 encoded.'}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
@@ -288,41 +476,267 @@ def logout():
     return redirect(url_for('login'))
 
 
-@app.route('/options', methods=['GET'])
+@route('/options', methods=['GET'])
 def get_options():
-    animals = ['Cat', 'Dog', 'Rabbit', 'Parrot', 'Hamster']
-    genders = ['Male', 'Female']
-    return {'animals': animals, 'genders': genders}
+    return current_app.extensions['response_cache'].get(('options',)).response()
 
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
 def dashboard():
     return render_template('dashboard.html', user_email=current_user.email)
 
 
-@app.route('/profile')
+@route('/profile')
 @login_required
 def profile():
     return render_template('profile.html', user_email=current_user.email)
 
 
-@app.route('/medication', methods=['GET'])
+@route('/history', methods=['GET'])
+@login_required
+def history():
+    # Keyset pagination: pass the returned next_before_id to get the next
+    # page, so every page is one range scan on (user_id, id).
+    from batch_scoring import SYMPTOM_FIELDS
+
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    before_id = request.args.get('before_id', type=int)
+    query = Prediction.query.filter(Prediction.user_id == current_user.id)
+    if before_id is not None:
+        query = query.filter(Prediction.id < before_id)
+    rows = query.order_by(Prediction.id.desc()).limit(limit).all()
+    return jsonify({
+        'items': [{
+            'id': row.id,
+            'created_at': row.created_at,
+            'source': row.source,
+            'animal': row.animal,
+            'age': row.age,
+            'gender': row.gender,
+            'symptoms': [name for bit, name in enumerate(SYMPTOM_FIELDS)
+                         if row.symptoms >> bit & 1],
+            'disease': row.disease,
+        } for row in rows],
+        'next_before_id': rows[-1].id if len(rows) == limit else None,
+    })
+
+
+@route('/model', methods=['GET'])
+def model_info():
+    service = model_service()
+    info = {'loaded': service.loaded,
+            'startup': dict(current_app.extensions['startup_timings'], **service.timings)}
+    if service.loaded:
+        model = service.get()
+        manifest = model.manifest
+        info['version'] = manifest.get('version')
+        info['trained_at'] = manifest.get('trained_at')
+        info['training_seconds'] = manifest.get('training_seconds')
+        info['params'] = manifest.get('params')
+        info['prediction_table'] = model.prediction_table.info()
+    info['retrain'] = service.retrain_status
+    batcher = current_app.extensions.get('predict_batcher')
+    if batcher is not None:
+        info['scheduler'] = batcher.stats()
+    return jsonify(info)
+
+
+@route('/model/retrain', methods=['POST'])
+@login_required
+def retrain_model():
+    # Retrains on the current dataset in a background thread. The new forest
+    # replaces the live one only if it validates, and requests already in
+    # flight finish on the model they started with.
+    if current_user.email not in current_app.config['MODEL_ADMINS']:
+        return jsonify({'error': 'Retraining is restricted to model administrators.'}), 403
+    service = model_service()
+    started = service.retrain(
+        n_jobs=current_app.config['RETRAIN_JOBS'],
+        min_accuracy=current_app.config['RETRAIN_MIN_ACCURACY'],
+        tolerance=current_app.config['RETRAIN_TOLERANCE'],
+        validation_fraction=current_app.config['RETRAIN_VALIDATION_FRACTION'])
+    if not started:
+        return jsonify({'error': 'A retrain is already running.',
+                        'retrain': service.retrain_status}), 409
+    return jsonify({'retrain': service.retrain_status}), 202
+
+
+@route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@route('/metrics/profiler', methods=['GET', 'POST'])
+@login_required
+def sampling_profiler():
+    if current_user.email not in current_app.config['MODEL_ADMINS']:
+        return jsonify({'error': 'The profiler is restricted to model administrators.'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        action = data.get('action')
+        if action == 'start':
+            try:
+                interval = float(data.get('interval') or 0)
+            except (TypeError, ValueError):
+                interval = -1
+            if not 0 <= interval < float('inf'):
+                return jsonify({'error': 'interval must be a non-negative number of seconds.'}), 400
+            profiler.start(interval or None)
+        elif action == 'stop':
+            profiler.stop()
+        else:
+            return jsonify({'error': "Expected action 'start' or 'stop'."}), 400
+        return jsonify({'running': profiler.running, 'interval': profiler.interval})
+    # Collapsed stacks, one "frame;frame;... count" line per distinct stack.
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+
+@route('/medication', methods=['GET'])
 def get_medication():
     disease = request.args.get('disease')
     if not disease:
         return jsonify({'error': 'No disease provided.'}), 400
-    treatment = medication_mapping.get(disease)
-    if not treatment:
+    cached = current_app.extensions['response_cache'].get(('medication', disease))
+    if cached is None:
         return jsonify({'error': 'No medication info found for this disease.'}), 404
-    return jsonify({
-        'treatment': treatment['description'],
-        'medications': treatment['products']
-    })
+    return cached.response()
+
+
+# --------------------- App Factory ---------------------
+def create_app(config=None):
+    started = time.perf_counter()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+    app.config['SECRET_KEY'] = 'thisisasecretkey'
+    app.config['ADMIN_ENABLED'] = True
+    # bcrypt cost factor and the pool that runs it off the request threads.
+    app.config['BCRYPT_LOG_ROUNDS'] = 12
+    app.config['BCRYPT_WORKERS'] = 2
+    app.config['BCRYPT_MAX_PENDING'] = 16
+    app.config['USER_CACHE_TTL'] = 60
+    # Prediction history is queued and inserted in batches of up to
+    # HISTORY_BATCH_SIZE rows at least every HISTORY_FLUSH_INTERVAL seconds.
+    app.config['HISTORY_ENABLED'] = True
+    app.config['HISTORY_BATCH_SIZE'] = 500
+    app.config['HISTORY_FLUSH_INTERVAL'] = 1.0
+    app.config['HISTORY_MAX_QUEUE'] = 100000
+    # '' loads the model on first use, 'background' starts loading it in a
+    # thread right away and 'eager' loads it before create_app returns.
+    app.config['MODEL_PRELOAD'] = os.environ.get('VETCARE_PRELOAD', '')
+    # A retrain first fits a candidate without RETRAIN_VALIDATION_FRACTION of
+    # the rows and is rejected if its accuracy on them is below
+    # RETRAIN_MIN_ACCURACY, or more than RETRAIN_TOLERANCE below always
+    # predicting the most common class; an accepted forest is refitted on
+    # all rows. Only the emails listed in MODEL_ADMINS may start a retrain.
+    app.config['RETRAIN_JOBS'] = 1
+    app.config['RETRAIN_MIN_ACCURACY'] = 0.1
+    app.config['RETRAIN_TOLERANCE'] = 0.02
+    app.config['RETRAIN_VALIDATION_FRACTION'] = 0.2
+    app.config['MODEL_ADMINS'] = {email.strip() for email in
+                                  os.environ.get('VETCARE_MODEL_ADMINS', '').split(',')
+                                  if email.strip()}
+    # How often each worker checks instance/model for a forest saved by
+    # another process (0 disables the check).
+    app.config['MODEL_RELOAD_INTERVAL'] = 5.0
+    # /predict and /healthcheck requests that arrive together are scored as
+    # one batch of up to PREDICT_BATCH_MAX cases, waiting at most
+    # PREDICT_BATCH_WAIT_MS for company, and only while traffic is concurrent.
+    app.config['PREDICT_BATCHING'] = True
+    app.config['PREDICT_BATCH_MAX'] = 256
+    app.config['PREDICT_BATCH_WAIT_MS'] = 2.0
+    # Cache lifetimes for the prebuilt /options, /medication and static/
+    # responses; clients revalidate with their ETags afterwards. Text bodies
+    # of at least COMPRESS_MIN_SIZE bytes are sent gzip or brotli encoded,
+    # for dynamic responses only from the endpoints in COMPRESS_ENDPOINTS,
+    # none of which render a CSRF token or other secret.
+    app.config['RESPONSE_CACHE_MAX_AGE'] = 300
+    app.config['STATIC_CACHE_MAX_AGE'] = 3600
+    app.config['COMPRESS_ENABLED'] = True
+    app.config['COMPRESS_MIN_SIZE'] = 1024
+    app.config['COMPRESS_ENDPOINTS'] = {'home', 'dashboard', 'healthcheck', 'predict',
+                                        'predict_batch', 'history', 'model_info',
+                                        'get_metrics'}
+    app.config.update(config or {})
+
+    db.init_app(app)
+    init_database(app)
+    login_manager = LoginManager(app)
+    login_manager.login_view = 'login'
+    login_manager.user_loader(load_user)
+    user_cache = app.extensions['user_cache'] = UserCache(ttl=app.config['USER_CACHE_TTL'])
+    service = app.extensions['model_service'] = ModelService(
+        reload_interval=app.config['MODEL_RELOAD_INTERVAL'])
+    if app.config['HISTORY_ENABLED']:
+        app.extensions['history_writer'] = HistoryWriter(
+            app, db, Prediction.__table__,
+            batch_size=app.config['HISTORY_BATCH_SIZE'],
+            flush_interval=app.config['HISTORY_FLUSH_INTERVAL'],
+            max_queue=app.config['HISTORY_MAX_QUEUE'])
+    if app.config['PREDICT_BATCHING']:
+        app.extensions['predict_batcher'] = MicroBatcher(
+            max_batch_size=app.config['PREDICT_BATCH_MAX'],
+            max_wait=app.config['PREDICT_BATCH_WAIT_MS'] / 1000)
+    app.extensions['password_hasher'] = PasswordHasher(
+        workers=app.config['BCRYPT_WORKERS'],
+        max_pending=app.config['BCRYPT_MAX_PENDING'])
+    app.extensions['response_cache'] = build_response_cache(app)
+    if 'static' in app.view_functions:
+        app.view_functions['static'] = send_static
+
+    from flask_cors import CORS
+    CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
+
+    # --------------------- Flask-Admin Setup ---------------------
+    if app.config['ADMIN_ENABLED']:
+        from flask_admin import Admin
+        from admin_views import UserAdminView
+
+        admin = Admin(app, name='VetCare Admin', template_mode='bootstrap3')
+        admin.add_view(UserAdminView(User, db.session, user_cache))
+
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    if app.config['COMPRESS_ENABLED']:
+        # Registered last so it runs first and the timing includes it.
+        app.after_request(compress_response)
+    for rule, view_func, options in _routes:
+        app.add_url_rule(rule, view_func=view_func, **options)
+
+    startup_timings = app.extensions['startup_timings'] = {
+        'create_app': time.perf_counter() - started,
+        # CPU time the process has spent so far, which is mostly imports.
+        'process_cpu': time.process_time(),
+    }
+    for phase, seconds in startup_timings.items():
+        metrics.set_gauge('vetcare_startup_phase_seconds', seconds, phase=phase)
+
+    preload = app.config['MODEL_PRELOAD']
+    if preload == 'eager':
+        service.preload(background=False)
+    elif preload == 'background':
+        service.preload()
+    return app
+
+
+# The default app behind `app.app` (WSGI servers, `flask run`) is built on
+# first access rather than at import.
+_app = None
+_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
 
 
 # --------------------- Main ---------------------
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
+    app = create_app()
     app.run(debug=True)
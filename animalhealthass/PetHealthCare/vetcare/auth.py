@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+class HasherBusy(RuntimeError):
+    pass
+
+
+# bcrypt is deliberately slow and releases the GIL while it runs, so hashing
+# on a small dedicated pool caps how many cores logins can take at once.
+# Requests beyond max_pending are rejected straight away instead of piling
+# up behind the pool and stalling the worker threads that serve predictions.
+class PasswordHasher:
+    def __init__(self, workers=2, max_pending=16, timeout=10.0):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many password checks in progress.')
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # The hash keeps its slot until it finishes, so a saturated pool
+            # keeps turning requests away until it drains.
+            raise HasherBusy('Timed out waiting for a password check.') from None
+
+    def generate_password_hash(self, bcrypt, password):
+        return self._run(bcrypt.generate_password_hash, password).decode('utf-8')
+
+    def check_password_hash(self, bcrypt, pw_hash, password):
+        return self._run(bcrypt.check_password_hash, pw_hash, password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+# Small LRU cache of loaded users with a time-to-live. It is per process, so
+# the TTL bounds how long another worker can serve a user that was changed
+# elsewhere; local changes call invalidate() directly.
+class UserCache:
+    def __init__(self, ttl=60.0, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        user = loader(user_id)
+        if user is not None and self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, user)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
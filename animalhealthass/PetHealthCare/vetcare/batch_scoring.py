@@ -0,0 +1,310 @@
+import csv
+import io
+import json
+import os
+from collections import deque
+from itertools import chain, islice, zip_longest
+from json.encoder import encode_basestring_ascii
+from multiprocessing import Pool
+
+import numpy as np
+
+SYMPTOM_FIELDS = ['fever', 'cough', 'vomiting', 'diarrhea',
+                  'lethargy', 'appetite', 'sneezing', 'rash']
+# Accepted spellings of each input field: the API name and the dataset's
+# column header. CSV headers are matched case-insensitively.
+FIELD_KEYS = {
+    'id': ('id', 'ID'),
+    'animal': ('animal', 'Animal'),
+    'age': ('age', 'Age'),
+    'gender': ('gender', 'Gender'),
+    'fever': ('fever', 'Fever'),
+    'cough': ('cough', 'Cough'),
+    'vomiting': ('vomiting', 'Vomiting'),
+    'diarrhea': ('diarrhea', 'Diarrhea'),
+    'lethargy': ('lethargy', 'Lethargy'),
+    'appetite': ('appetite', 'Loss of Appetite'),
+    'sneezing': ('sneezing', 'Sneezing'),
+    'rash': ('rash', 'Skin Rash'),
+}
+HEADER_FIELDS = {key.lower(): field for field, keys in FIELD_KEYS.items() for key in keys}
+FLAG_VALUES = {'1': 1, 'yes': 1, 'true': 1, '0': 0, 'no': 0, 'false': 0, '': 0}
+CHUNK_SIZE = 10000
+HEALTHY = {
+    'disease': 'Healthy',
+    'treatment_description': 'No medication required. Maintain good nutrition and regular check-ups.',
+    'medications': []
+}
+NO_MEDICATION_INFO = {
+    'description': 'Consult a veterinarian for appropriate medication.',
+    'products': []
+}
+CSV_HEADER = ['id', 'disease', 'treatment_description', 'medications', 'error']
+
+# Labels for rows the forest does not score.
+_HEALTHY, _INVALID = -1, -2
+
+
+def _flag(value):
+    if value is None or isinstance(value, bool):
+        return int(bool(value))
+    if isinstance(value, (int, float)):
+        return int(value) if value in (0, 1) else -1
+    return FLAG_VALUES.get(str(value).strip().lower(), -1)
+
+
+def _flags(values):
+    # A column holds a handful of distinct spellings, so each is parsed once.
+    try:
+        table = {value: _flag(value) for value in set(values)}
+    except TypeError:  # unhashable JSON values
+        return np.fromiter(map(_flag, values), dtype=np.int8, count=len(values))
+    return np.fromiter(map(table.__getitem__, values), dtype=np.int8, count=len(values))
+
+
+def _json_value(value):
+    return encode_basestring_ascii(value) if isinstance(value, str) else json.dumps(value)
+
+
+def _floats(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        def number(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return np.nan
+        return np.fromiter((number(value) for value in values), dtype=np.float64,
+                           count=len(values))
+
+
+def csv_columns(header, lines):
+    rows = list(csv.reader(lines))
+    transposed = list(zip_longest(*rows, fillvalue=''))
+    columns = {}
+    for index, name in enumerate(header):
+        field = HEADER_FIELDS.get(name.strip().lower())
+        if field is not None and field not in columns:
+            columns[field] = (list(transposed[index]) if index < len(transposed)
+                              else [''] * len(rows))
+    return columns, len(rows), {}
+
+
+def ndjson_columns(lines):
+    records, errors = [], {}
+    for i, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record, errors[i] = {}, str(e)
+        records.append(record)
+    return record_columns(records, errors)
+
+
+def record_columns(records, errors=None):
+    # Columns from parsed JSON cases; anything but an object is a row error.
+    errors = dict(errors or {})
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.setdefault(i, 'Expected a JSON object.')
+    records = [record if isinstance(record, dict) else {} for record in records]
+    columns = {}
+    for field, keys in FIELD_KEYS.items():
+        present = [key for key in keys if any(key in record for record in records)]
+        if present:
+            columns[field] = [next((record[key] for key in present if key in record), None)
+                              for record in records]
+    return columns, len(records), errors
+
+
+def chunk_columns(chunk):
+    # chunk is (format, CSV header, lines or parsed JSON records).
+    input_format, header, lines = chunk
+    if input_format == 'csv':
+        return csv_columns(header, lines)
+    if input_format == 'records':
+        return record_columns(lines)
+    return ndjson_columns(lines)
+
+
+# Scores chunks of cases column by column: each chunk is encoded with a few
+# array operations and scored with one prediction table call, and the
+# treatment info for every disease is serialized once up front. main.py's
+# batch mode and /predict/batch both score through this class.
+class BatchScorer:
+    def __init__(self, feature_encoder, prediction_table, medication_mapping,
+                 output_format='ndjson', no_medication_info=NO_MEDICATION_INFO):
+        if output_format not in ('ndjson', 'csv'):
+            raise ValueError(f"Unknown output format: {output_format!r}")
+        self.feature_encoder = feature_encoder
+        self.prediction_table = prediction_table
+        self.output_format = output_format
+        results = {_HEALTHY: HEALTHY}
+        for code, disease in enumerate(feature_encoder.diseases):
+            medication_info = medication_mapping.get(disease, no_medication_info)
+            results[code] = {
+                'disease': disease,
+                'treatment_description': medication_info['description'],
+                'medications': medication_info['products']
+            }
+        self.results = results
+        # JSON bodies without the opening brace, so an id can be prepended.
+        self._json = {code: json.dumps(result)[1:] for code, result in results.items()}
+        self._csv = {code: [result['disease'], result['treatment_description'],
+                            '; '.join(m['name'] for m in result['medications']), '']
+                     for code, result in results.items()}
+
+    def header(self):
+        return ','.join(CSV_HEADER) + '\n' if self.output_format == 'csv' else ''
+
+    def score_columns(self, columns, n_rows, errors):
+        ages, symptoms, messages = self.parse_columns(columns, n_rows, errors)
+        return self.predict_columns(columns, ages, symptoms, messages), messages
+
+    def parse_columns(self, columns, n_rows, errors):
+        # Ages (NaN if invalid), 0/1 symptom flags and {row: error message}.
+        missing = [None] * n_rows
+        ages = _floats([None if value == '' else value
+                        for value in columns.get('age', missing)])
+        symptoms = np.column_stack([_flags(columns.get(field, missing))
+                                    for field in SYMPTOM_FIELDS])
+        messages = dict(errors)
+        bad_symptoms = (symptoms < 0).any(axis=1)
+        for i in np.flatnonzero(bad_symptoms | np.isnan(ages)):
+            messages.setdefault(int(i), 'Invalid symptom value.' if bad_symptoms[i]
+                                else 'Invalid or missing age.')
+        return ages, symptoms, messages
+
+    def predict_columns(self, columns, ages, symptoms, messages):
+        # Disease codes, _HEALTHY or _INVALID per row; rows with an unknown
+        # animal or gender get a message added to messages.
+        n_rows = len(ages)
+        missing = [None] * n_rows
+        labels = np.full(n_rows, _INVALID, dtype=np.int64)
+        valid = np.ones(n_rows, dtype=bool)
+        valid[list(messages)] = False
+        # Same rule as the interactive mode and /predict: no symptoms is
+        # Healthy whatever the animal.
+        healthy = valid & ~symptoms.any(axis=1)
+        labels[healthy] = _HEALTHY
+
+        rows = np.flatnonzero(valid & ~healthy)
+        if len(rows):
+            animals = [columns.get('animal', missing)[i] for i in rows]
+            genders = [columns.get('gender', missing)[i] for i in rows]
+            X = np.empty((len(rows), 3 + len(SYMPTOM_FIELDS)), dtype=np.float64)
+            X[:, 0] = self.feature_encoder.encode_column('animal', animals)
+            X[:, 1] = ages[rows]
+            X[:, 2] = self.feature_encoder.encode_column('gender', genders)
+            X[:, 3:] = symptoms[rows]
+            known = (X[:, 0] >= 0) & (X[:, 2] >= 0)
+            for j in np.flatnonzero(~known):
+                messages[int(rows[j])] = (f"Unknown animal or gender: "
+                                          f"{animals[j]!r}, {genders[j]!r}")
+            if known.any():
+                labels[rows[known]] = self.prediction_table.predict_many(X[known])
+        return labels
+
+    def result_dicts(self, labels, messages, ids=None):
+        # The rows render() writes, as dicts for a JSON response.
+        results = [self.results[label] if label != _INVALID else {'error': messages[i]}
+                   for i, label in enumerate(labels.tolist())]
+        if ids:
+            results = [{'id': ids[i], **result} for i, result in enumerate(results)]
+        return results
+
+    def render(self, labels, messages, ids=None):
+        labels = labels.tolist()
+        if self.output_format == 'csv':
+            out = io.StringIO()
+            csv.writer(out, lineterminator='\n').writerows(
+                [ids[i] if ids else ''] + (self._csv[label] if label != _INVALID
+                                           else ['', '', '', messages[i]])
+                for i, label in enumerate(labels))
+            return out.getvalue()
+
+        bodies = [self._json[label] if label != _INVALID
+                  else json.dumps({'error': messages[i]})[1:]
+                  for i, label in enumerate(labels)]
+        if ids:
+            bodies = ['"id": ' + _json_value(ids[i]) + ', ' + body
+                      for i, body in enumerate(bodies)]
+        return ''.join('{' + body + '\n' for body in bodies)
+
+    def score_chunk(self, chunk):
+        columns, n_rows, errors = chunk_columns(chunk)
+        labels, messages = self.score_columns(columns, n_rows, errors)
+        return self.render(labels, messages, columns.get('id')), n_rows
+
+
+# --------------------- Pipeline ---------------------
+
+
+def read_chunks(stream, chunk_size=CHUNK_SIZE, input_format=None):
+    # Yields (format, CSV header, lines) for every chunk_size non-blank
+    # lines. Without an explicit format, input whose first line starts with
+    # '{' is NDJSON and anything else is CSV with a header row. Quoted CSV
+    # fields may not span lines.
+    lines = (line for line in stream if line.strip())
+    first = next(lines, None)
+    if first is None:
+        return
+    if input_format is None:
+        input_format = 'ndjson' if first.lstrip().startswith('{') else 'csv'
+    header = None
+    if input_format == 'csv':
+        header = next(csv.reader([first]))
+    else:
+        lines = chain([first], lines)
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield input_format, header, chunk
+
+
+# Worker-side scorer, set once per process.
+_scorer = None
+
+
+def _init_worker(scorer):
+    global _scorer
+    _scorer = scorer
+
+
+def _score_chunk(chunk):
+    return _scorer.score_chunk(chunk)
+
+
+def score_stream(stream, out, scorer, chunk_size=CHUNK_SIZE, n_jobs=1,
+                 input_format=None):
+    # Writes one result per input row to out, in input order, and returns
+    # the number of rows. With n_jobs > 1 chunks are scored on a process
+    # pool with at most two chunks per worker in flight, so memory stays
+    # bounded for any input size.
+    chunks = read_chunks(stream, chunk_size, input_format)
+    out.write(scorer.header())
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count()
+    total = 0
+    if not n_jobs or n_jobs == 1:
+        for chunk in chunks:
+            text, n_rows = scorer.score_chunk(chunk)
+            out.write(text)
+            total += n_rows
+        return total
+
+    with Pool(n_jobs, initializer=_init_worker, initargs=(scorer,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_score_chunk, (chunk,)))
+            while len(pending) > 2 * n_jobs or (pending and pending[0].ready()):
+                text, n_rows = pending.popleft().get()
+                out.write(text)
+                total += n_rows
+        while pending:
+            text, n_rows = pending.popleft().get()
+            out.write(text)
+            total += n_rows
+    return total
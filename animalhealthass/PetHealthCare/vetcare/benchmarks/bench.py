@@ -0,0 +1,197 @@
+# Performance benchmarks for training, inference and HTTP serving.
+#
+#   python benchmarks/bench.py --output results.json
+#   python benchmarks/bench.py --scales 1,10 --compare results.json --tolerance 15
+#
+# Synthetic datasets are resampled from animal_health_dataset.csv at each
+# scale, so they keep its schema and class structure. With --compare the run
+# exits non-zero if any metric is worse than the baseline by more than
+# --tolerance percent.
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+VETCARE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, VETCARE_DIR)
+
+from decision_tree import build_tree  # noqa: E402
+from flat_forest import compile_forest, predict_labels  # noqa: E402
+from dataset_cache import load_dataset  # noqa: E402
+from random_forest import bagging_predict, random_forest  # noqa: E402
+from utils import load_and_prepare_data  # noqa: E402
+
+BASE_DATASET = os.path.join(VETCARE_DIR, 'animal_health_dataset.csv')
+PARAMS = {'max_depth': 5, 'min_size': 5, 'sample_size': 0.8, 'n_trees': 10}
+SAMPLE_CASE = {'animal': 'Dog', 'age': 3, 'gender': 'Male', 'fever': 1,
+               'cough': 1, 'vomiting': 0, 'diarrhea': 1, 'lethargy': 0,
+               'appetite': 1, 'sneezing': 0, 'rash': 0}
+
+
+def synthetic_dataset(scale, seed=0):
+    base = pd.read_csv(BASE_DATASET)
+    rng = np.random.default_rng(seed)
+    df = base.iloc[rng.integers(0, len(base), len(base) * scale)].reset_index(drop=True)
+    df['Age'] = np.clip(df['Age'] + rng.integers(-1, 2, len(df)), 0, None)
+    return df
+
+
+def timed(fn, repeat=1):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def bench_scale(scale, repeat):
+    results = {'rows': 510 * scale}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'dataset.csv')
+        synthetic_dataset(scale).to_csv(path, index=False)
+        results['load_seconds'], (data, encoders) = timed(
+            lambda: load_and_prepare_data(path), repeat)
+        cache_dir = os.path.join(tmp, 'cache')
+        load_dataset(path, cache_dir)
+        results['load_cached_seconds'], _ = timed(
+            lambda: load_dataset(path, cache_dir), repeat)
+
+    X = data[:, :-1]
+    results['build_tree_seconds'], _ = timed(
+        lambda: build_tree(data, PARAMS['max_depth'], PARAMS['min_size']), repeat)
+    results['build_tree_hist_seconds'], _ = timed(
+        lambda: build_tree(data, PARAMS['max_depth'], PARAMS['min_size'],
+                           splitter='hist'), repeat)
+    results['random_forest_seconds'], trees = timed(
+        lambda: random_forest(data, X[:0], PARAMS['max_depth'], PARAMS['min_size'],
+                              PARAMS['sample_size'], PARAMS['n_trees'], seed=0),
+        repeat)
+    results['random_forest_sqrt_seconds'], _ = timed(
+        lambda: random_forest(data, X[:0], PARAMS['max_depth'], PARAMS['min_size'],
+                              PARAMS['sample_size'], PARAMS['n_trees'], seed=0,
+                              max_features='sqrt'),
+        repeat)
+
+    rows = X[:min(len(X), 2000)]
+    latencies = []
+    for row in rows:
+        start = time.perf_counter()
+        bagging_predict(trees, row)
+        latencies.append(time.perf_counter() - start)
+    results['bagging_predict_p50_ms'] = percentile_ms(latencies, 50)
+    results['bagging_predict_p99_ms'] = percentile_ms(latencies, 99)
+
+    forest = compile_forest(trees, len(encoders['Disease'].classes_))
+    batch_seconds, _ = timed(lambda: predict_labels(forest, X), max(repeat, 3))
+    results['batch_predict_rows_per_second'] = len(X) / batch_seconds
+    return results
+
+
+def bench_http(n_requests):
+    os.chdir(VETCARE_DIR)
+    import app as vetcare_app
+
+    vetcare_app.app.config['LOGIN_DISABLED'] = True
+    client = vetcare_app.app.test_client()
+    client.post('/predict', json=SAMPLE_CASE)
+
+    latencies = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        response = client.post('/predict', json=SAMPLE_CASE)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict returned {response.status_code}")
+    return {
+        'requests': n_requests,
+        'predict_p50_ms': percentile_ms(latencies, 50),
+        'predict_p99_ms': percentile_ms(latencies, 99),
+    }
+
+
+# Metrics where a larger number is better; every other timing is a cost.
+HIGHER_IS_BETTER = ('_per_second',)
+LOWER_IS_BETTER = ('_seconds', '_ms')
+
+
+def compare(current, baseline, tolerance):
+    regressions = []
+    for group, metrics in current['results'].items():
+        for name, value in metrics.items():
+            old = baseline.get('results', {}).get(group, {}).get(name)
+            if not old:
+                continue
+            if name.endswith(HIGHER_IS_BETTER):
+                change = (old - value) / old * 100
+            elif name.endswith(LOWER_IS_BETTER):
+                change = (value - old) / old * 100
+            else:
+                continue
+            if change > tolerance:
+                regressions.append(f"{group}.{name}: {old:.6g} -> {value:.6g} "
+                                   f"({change:+.1f}% worse)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark training, inference and HTTP serving.')
+    parser.add_argument('--scales', default='1,10,100,1000',
+                        help='comma-separated dataset multipliers')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs per timing; the fastest is kept')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='number of /predict calls (0 skips HTTP)')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--compare', help='baseline results JSON')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='allowed regression in percent')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'params': PARAMS,
+            'timestamp': time.time(),
+        },
+        'results': {},
+    }
+    for scale in (int(s) for s in args.scales.split(',')):
+        print(f"scale {scale}x ...", file=sys.stderr)
+        report['results'][f'scale_{scale}x'] = bench_scale(scale, args.repeat)
+    if args.requests:
+        print("http ...", file=sys.stderr)
+        report['results']['http'] = bench_http(args.requests)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print('REGRESSION', line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
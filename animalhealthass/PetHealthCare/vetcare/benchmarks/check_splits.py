@@ -0,0 +1,117 @@
+# Regression check for the split finder.
+#
+#   python benchmarks/check_splits.py
+#   python benchmarks/check_splits.py --trials 200 --seed 1
+#
+# get_split and build_tree (splitter='exact') must choose exactly the splits
+# of the original exhaustive search, which tried every row's value of every
+# feature with test_split and kept the first strictly lower gini_index. This
+# rebuilds trees both ways on bootstrap samples of animal_health_dataset.csv
+# and on small random datasets full of ties, and exits non-zero on the first
+# difference.
+import argparse
+import os
+import sys
+
+import numpy as np
+
+VETCARE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, VETCARE_DIR)
+
+from decision_tree import build_tree, get_split, gini_index, test_split, to_terminal  # noqa: E402
+from utils import load_and_prepare_data  # noqa: E402
+
+BASE_DATASET = os.path.join(VETCARE_DIR, 'animal_health_dataset.csv')
+
+
+def reference_split(dataset):
+    class_values = list(set(row[-1] for row in dataset))
+    best_index, best_value, best_score, best_groups = 999, None, 999, None
+    for index in range(dataset.shape[1] - 1):
+        for row in dataset:
+            groups = test_split(index, row[index], dataset)
+            gini = gini_index(groups, class_values)
+            if gini < best_score:
+                best_index, best_value, best_score, best_groups = index, row[index], gini, groups
+    return {'index': best_index, 'value': best_value, 'groups': best_groups}
+
+
+def reference_tree(train, max_depth, min_size):
+    root = reference_split(train)
+    stack = [(root, 1)]
+    while stack:
+        node, depth = stack.pop()
+        left, right = node.pop('groups')
+        if len(left) == 0 or len(right) == 0:
+            node['left'] = node['right'] = to_terminal(np.vstack((left, right)))
+            continue
+        if depth >= max_depth:
+            node['left'], node['right'] = to_terminal(left), to_terminal(right)
+            continue
+        for side, group in (('left', left), ('right', right)):
+            if len(group) <= min_size:
+                node[side] = to_terminal(group)
+            else:
+                node[side] = reference_split(group)
+                stack.append((node[side], depth + 1))
+    return root
+
+
+def same_tree(a, b):
+    if isinstance(a, dict) != isinstance(b, dict):
+        return False
+    if not isinstance(a, dict):
+        return a == b
+    return (a['index'] == b['index'] and a['value'] == b['value']
+            and same_tree(a['left'], b['left']) and same_tree(a['right'], b['right']))
+
+
+def tie_heavy_dataset(rng):
+    # Few distinct values per column and few classes, so many thresholds
+    # score the same and only the tie-breaking order picks the split.
+    n_rows = int(rng.integers(2, 60))
+    n_features = int(rng.integers(1, 5))
+    X = rng.integers(0, int(rng.integers(1, 5)), (n_rows, n_features)).astype(np.float64)
+    y = rng.integers(0, int(rng.integers(1, 4)), (n_rows, 1)).astype(np.float64)
+    return np.hstack((X, y))
+
+
+def check(data, max_depth, min_size):
+    expected = reference_split(data)
+    actual = get_split(data)
+    if (actual['index'], actual['value']) != (expected['index'], expected['value']):
+        return f"get_split chose {actual['index']}<{actual['value']}, " \
+               f"expected {expected['index']}<{expected['value']}"
+    if not same_tree(build_tree(data, max_depth, min_size),
+                     reference_tree(data, max_depth, min_size)):
+        return f"build_tree differs (max_depth={max_depth}, min_size={min_size})"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the split finder against '
+                                                 'the exhaustive search.')
+    parser.add_argument('--trials', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    base, _ = load_and_prepare_data(BASE_DATASET)
+    cases = []
+    for _ in range(args.trials):
+        sample = base[rng.choice(len(base), int(rng.integers(20, 120)), replace=True)]
+        cases.append(('bootstrap', sample))
+        cases.append(('ties', tie_heavy_dataset(rng)))
+
+    for trial, (kind, data) in enumerate(cases):
+        max_depth, min_size = int(rng.integers(1, 6)), int(rng.integers(1, 6))
+        error = check(data, max_depth, min_size)
+        if error:
+            print(f"FAIL {kind} case {trial}: {error}", file=sys.stderr)
+            return 1
+    print(f"OK: {len(cases)} datasets, splits match the exhaustive search")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from metrics import metrics
+from model_store import DATASET_PATH, file_hash, replace_directory
+
+CACHE_FORMAT_VERSION = 1
+CACHE_DIR = os.path.join('instance', 'dataset')
+TARGET = 'Disease'
+# CSVs larger than this are ingested chunk by chunk instead of with a single
+# read_csv, so building the cache never needs the whole file in memory.
+STREAM_THRESHOLD_BYTES = 256 << 20
+STREAM_CHUNK_ROWS = 100000
+
+
+def _range_dtype(low, high):
+    return np.result_type(np.min_scalar_type(low), np.min_scalar_type(high))
+
+
+def _compact_dtype(values):
+    # Smallest dtype that holds the column exactly.
+    if np.issubdtype(values.dtype, np.integer) or (
+            len(values) and np.array_equal(values, np.floor(values))):
+        if not len(values):
+            return _range_dtype(0, 0)
+        return _range_dtype(int(values.min()), int(values.max()))
+    if np.array_equal(values.astype(np.float32), values):
+        return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+
+def _ordered_columns(names):
+    return [c for c in names if c != TARGET] + [TARGET]
+
+
+def encode_frame(df):
+    # Same codes as fitting a LabelEncoder on every text column: the sorted
+    # distinct values are the vocabulary and a value's code is its position.
+    columns = _ordered_columns(df.columns)
+    encoded, classes, dtypes = [], {}, []
+    for column in columns:
+        values = df[column]
+        if values.dtype == 'object':
+            vocabulary, codes = np.unique(values.to_numpy(dtype=str), return_inverse=True)
+            classes[column] = [str(v) for v in vocabulary]
+            values = codes.ravel()
+        else:
+            values = values.to_numpy()
+        encoded.append(values)
+        dtypes.append(_compact_dtype(values))
+    return columns, encoded, dtypes, classes
+
+
+def _encode_csv(dataset_path):
+    import pandas as pd
+
+    columns, encoded, dtypes, classes = encode_frame(pd.read_csv(dataset_path))
+    # One column-major matrix in the narrowest dtype every column fits, so
+    # the trainer can use the memory-mapped file as its dataset directly.
+    data = np.empty((len(encoded[0]), len(columns)), order='F',
+                    dtype=np.result_type(*dtypes))
+    for index, values in enumerate(encoded):
+        data[:, index] = values
+    return data, columns, dtypes, classes
+
+
+def build_cache(dataset_path=DATASET_PATH, cache_dir=CACHE_DIR, source_hash=None):
+    source_hash = source_hash or file_hash(dataset_path)
+    data, columns, dtypes, classes = _encode_csv(dataset_path)
+    return write_cache(cache_dir, data, columns, dtypes, classes, source_hash)
+
+
+def _manifest(n_rows, columns, dtypes, classes, dtype, source_hash):
+    return {
+        'format_version': CACHE_FORMAT_VERSION,
+        'source_hash': source_hash,
+        'n_rows': int(n_rows),
+        'columns': [{'name': name, 'dtype': np.dtype(column_dtype).str,
+                     'classes': classes.get(name)}
+                    for name, column_dtype in zip(columns, dtypes)],
+        'dtype': np.dtype(dtype).str,
+    }
+
+
+def _staging_dir(cache_dir):
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(dir=parent, prefix='.dataset-')
+
+
+def _publish(staging, cache_dir, manifest):
+    with open(os.path.join(staging, 'dataset.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    replace_directory(staging, cache_dir)
+    return manifest
+
+
+def write_cache(cache_dir, data, columns, dtypes, classes, source_hash):
+    staging = _staging_dir(cache_dir)
+    np.save(os.path.join(staging, 'data.npy'), data)
+    manifest = _manifest(data.shape[0], columns, dtypes, classes, data.dtype, source_hash)
+    return _publish(staging, cache_dir, manifest)
+
+
+# --------------------- Streaming Ingestion ---------------------
+
+
+class _ColumnSpill:
+    # Provisional per-column storage while streaming: text columns as int32
+    # codes in first-seen order, numbers as float64. Both are appended to a
+    # file in the staging directory, so memory use is one chunk at a time.
+    def __init__(self, path, text):
+        self.path = path
+        self.text = text
+        self.dtype = np.dtype(np.int32 if text else np.float64)
+        self.vocabulary = {}
+        self.low, self.high = np.inf, -np.inf
+        self.integral = True
+        self.float32_exact = True
+        self._file = open(path, 'wb')
+
+    def append(self, values):
+        if self.text:
+            distinct, inverse = np.unique(values.to_numpy(dtype=str), return_inverse=True)
+            codes = np.array([self.vocabulary.setdefault(value, len(self.vocabulary))
+                              for value in distinct], dtype=np.int32)
+            encoded = codes[inverse.ravel()]
+        else:
+            if values.dtype == 'object':
+                raise ValueError(f"Column {values.name!r} mixes numbers and text.")
+            encoded = values.to_numpy(dtype=np.float64)
+            if len(encoded):
+                self.low = min(self.low, encoded.min())
+                self.high = max(self.high, encoded.max())
+                self.integral &= bool(np.array_equal(encoded, np.floor(encoded)))
+                self.float32_exact &= bool(np.array_equal(encoded.astype(np.float32), encoded))
+        self._file.write(np.ascontiguousarray(encoded).tobytes())
+        return encoded
+
+    def close(self):
+        self._file.close()
+
+    def finish(self):
+        # Final dtype, the sorted vocabulary and a lookup table from the
+        # provisional codes to the sorted codes build_cache would assign.
+        self.close()
+        if self.text:
+            vocabulary = sorted(self.vocabulary)
+            remap = np.empty(len(vocabulary), dtype=np.int64)
+            for code, value in enumerate(vocabulary):
+                remap[self.vocabulary[value]] = code
+            return _range_dtype(0, max(len(vocabulary) - 1, 0)), vocabulary, remap
+        if self.low > self.high:
+            return _range_dtype(0, 0), None, None
+        if self.integral:
+            return _range_dtype(int(self.low), int(self.high)), None, None
+        return np.dtype(np.float32 if self.float32_exact else np.float64), None, None
+
+    def read(self, n_rows):
+        return np.memmap(self.path, dtype=self.dtype, mode='r', shape=(n_rows,))
+
+
+def _reservoir_update(reservoir, seen, block, rng):
+    # Algorithm R: after n rows every row is in the sample with probability
+    # size / n. Rows past the first size replace a random slot; only the
+    # replacements are applied, one by one and in order.
+    size = len(reservoir)
+    fill = min(max(size - seen, 0), len(block))
+    reservoir[seen:seen + fill] = block[:fill]
+    if fill < len(block):
+        positions = np.arange(seen + fill, seen + len(block))
+        slots = rng.integers(0, positions + 1)
+        for offset in np.flatnonzero(slots < size):
+            reservoir[slots[offset]] = block[fill + offset]
+
+
+def stream_cache(dataset_path=DATASET_PATH, cache_dir=CACHE_DIR, source_hash=None,
+                 chunk_rows=STREAM_CHUNK_ROWS, reservoir_size=None, seed=None):
+    # Builds the same cache as build_cache in one pass over the CSV. The
+    # final matrix is written straight into a memory-mapped .npy file, and
+    # reservoir_size rows can also be kept as a uniform sample for bootstrap
+    # draws on datasets too large to train on in full.
+    import pandas as pd
+
+    source_hash = source_hash or file_hash(dataset_path)
+    staging = _staging_dir(cache_dir)
+    rng = np.random.default_rng(seed)
+    columns, spills, reservoir, n_rows = None, [], None, 0
+    try:
+        for chunk in pd.read_csv(dataset_path, chunksize=chunk_rows):
+            if columns is None:
+                columns = _ordered_columns(chunk.columns)
+                spills = [_ColumnSpill(os.path.join(staging, f'column-{index}.bin'),
+                                       chunk[column].dtype == 'object')
+                          for index, column in enumerate(columns)]
+                if reservoir_size:
+                    reservoir = np.empty((reservoir_size, len(columns)))
+            encoded = [spill.append(chunk[column]) for spill, column in zip(spills, columns)]
+            if reservoir is not None:
+                _reservoir_update(reservoir, n_rows, np.column_stack(encoded), rng)
+            n_rows += len(chunk)
+        if not n_rows:
+            raise ValueError(f"{dataset_path} has no rows.")
+
+        finished = [spill.finish() for spill in spills]
+        dtypes = [dtype for dtype, _, _ in finished]
+        classes = {column: vocabulary
+                   for column, (_, vocabulary, _) in zip(columns, finished)
+                   if vocabulary is not None}
+        dtype = np.result_type(*dtypes)
+        data = np.lib.format.open_memmap(os.path.join(staging, 'data.npy'), mode='w+',
+                                         dtype=dtype, shape=(n_rows, len(columns)),
+                                         fortran_order=True)
+        for index, (spill, (_, _, remap)) in enumerate(zip(spills, finished)):
+            source = spill.read(n_rows)
+            for start in range(0, n_rows, chunk_rows):
+                block = source[start:start + chunk_rows]
+                data[start:start + chunk_rows, index] = block if remap is None else remap[block]
+            del source
+            os.remove(spill.path)
+            if reservoir is not None and remap is not None:
+                reservoir[:, index] = remap[reservoir[:, index].astype(np.int64)]
+        data.flush()
+        del data
+
+        manifest = _manifest(n_rows, columns, dtypes, classes, dtype, source_hash)
+        if reservoir is not None:
+            reservoir = reservoir[:min(reservoir_size, n_rows)].astype(dtype)
+            np.save(os.path.join(staging, 'reservoir.npy'), reservoir)
+            manifest['reservoir_rows'] = len(reservoir)
+    except BaseException:
+        for spill in spills:
+            spill.close()
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return _publish(staging, cache_dir, manifest)
+
+
+# --------------------- Loading ---------------------
+
+
+def load_cache(cache_dir=CACHE_DIR, source_hash=None):
+    try:
+        with open(os.path.join(cache_dir, 'dataset.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format_version') != CACHE_FORMAT_VERSION:
+        return None
+    if source_hash is not None and manifest['source_hash'] != source_hash:
+        return None
+    try:
+        data = np.load(os.path.join(cache_dir, 'data.npy'), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if data.shape != (manifest['n_rows'], len(manifest['columns'])):
+        return None
+    classes = {column['name']: column['classes'] for column in manifest['columns']
+               if column['classes'] is not None}
+    return data, classes, manifest
+
+
+def load_reservoir(cache_dir=CACHE_DIR):
+    try:
+        return np.load(os.path.join(cache_dir, 'reservoir.npy'), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+def load_dataset(dataset_path=DATASET_PATH, cache_dir=CACHE_DIR, source_hash=None,
+                 use_reservoir=False):
+    # Returns the encoded matrix (target in the last column) and the class
+    # vocabulary of every text column, parsing the CSV only when the cache
+    # is missing or was built from a different file. With use_reservoir the
+    # cached row sample is returned instead of the full matrix when the
+    # cache has one.
+    source_hash = source_hash or file_hash(dataset_path)
+    cached = load_cache(cache_dir, source_hash)
+    if cached is None and os.path.getsize(dataset_path) > STREAM_THRESHOLD_BYTES:
+        with metrics.time_gauge('vetcare_training_phase_seconds', phase='build_dataset_cache'):
+            stream_cache(dataset_path, cache_dir, source_hash)
+        cached = load_cache(cache_dir, source_hash)
+    if cached is not None:
+        data, classes, _ = cached
+        if use_reservoir:
+            reservoir = load_reservoir(cache_dir)
+            if reservoir is not None:
+                data = reservoir
+        return data, classes
+
+    with metrics.time_gauge('vetcare_training_phase_seconds', phase='build_dataset_cache'):
+        data, columns, dtypes, classes = _encode_csv(dataset_path)
+        try:
+            write_cache(cache_dir, data, columns, dtypes, classes, source_hash)
+        except OSError:
+            pass  # Without a writable instance dir the CSV is parsed every time.
+    return data, classes
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build the binary dataset cache.')
+    parser.add_argument('dataset', nargs='?', default=DATASET_PATH)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--stream', action='store_true',
+                        help='read the CSV in chunks instead of all at once')
+    parser.add_argument('--chunk-rows', type=int, default=STREAM_CHUNK_ROWS)
+    parser.add_argument('--reservoir', type=int,
+                        help='also keep a uniform sample of this many rows (implies --stream)')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.stream or args.reservoir:
+        manifest = stream_cache(args.dataset, args.cache_dir, chunk_rows=args.chunk_rows,
+                                reservoir_size=args.reservoir, seed=args.seed)
+    else:
+        manifest = build_cache(args.dataset, args.cache_dir)
+    print(f"Cached {manifest['n_rows']} rows x {len(manifest['columns'])} columns "
+          f"({manifest['dtype']}) in {args.cache_dir}")
@@ -1,89 +1,272 @@
-import numpy as np
-from collections import Counter
-
-
-def gini_index(groups, classes):
-    n_instances = sum(len(group) for group in groups)
-    gini = 0.0
-    for group in groups:
-        size = len(group)
-        if size == 0:
-            continue
-        score = 0.0
-        _, counts = np.unique(group[:, -1], return_counts=True)
-        for count in counts:
-            p = count / size
-            score += p * p
-        gini += (1.0 - score) * (size / n_instances)
-    return gini
-
-
-def test_split(index, value, dataset):
-    left = dataset[dataset[:, index] < value]
-    right = dataset[dataset[:, index] >= value]
-    return left, right
-
-
-def get_split(dataset):
-    class_values = list(set(row[-1] for row in dataset))
-    best_index, best_value, best_score, best_groups = 999, None, 999, None
-    for index in range(dataset.shape[1] - 1):
-        for row in dataset:
-            groups = test_split(index, row[index], dataset)
-            gini = gini_index(groups, class_values)
-            if gini < best_score:
-                best_index, best_value, best_score, best_groups = index, row[index], gini, groups
-    return {
-        'index': best_index,
-        'value': best_value,
-        'groups': best_groups
-    }
-
-
-def to_terminal(group):
-    outcomes = [row[-1] for row in group]
-    return Counter(outcomes).most_common(1)[0][0]
-
-
-def split_node(node, max_depth, min_size, depth):
-    left, right = node['groups']
-    del(node['groups'])
-
-    if len(left) == 0 or len(right) == 0:
-        node['left'] = node['right'] = to_terminal(np.vstack((left, right)))
-        return
-
-    if depth >= max_depth:
-        node['left'], node['right'] = to_terminal(left), to_terminal(right)
-        return
-
-    if len(left) <= min_size:
-        node['left'] = to_terminal(left)
-    else:
-        node['left'] = get_split(left)
-        split_node(node['left'], max_depth, min_size, depth + 1)
-
-    if len(right) <= min_size:
-        node['right'] = to_terminal(right)
-    else:
-        node['right'] = get_split(right)
-        split_node(node['right'], max_depth, min_size, depth + 1)
-
-
-def build_tree(train, max_depth, min_size):
-    root = get_split(train)
-    split_node(root, max_depth, min_size, 1)
-    return root
-
-
-def predict(node, row):
-    if row[node['index']] < node['value']:
-        if isinstance(node['left'], dict):
-            return predict(node['left'], row)
-        else:
-            return node['left']
-    else:
-        if isinstance(node['right'], dict):
-            return predict(node['right'], row)
-        else:
-            return node['right']
+import math
+import numbers
+import numpy as np
+from collections import Counter
+
+MAX_BINS = 255
+
+
+def gini_index(groups, classes):
+    n_instances = sum(len(group) for group in groups)
+    gini = 0.0
+    for group in groups:
+        size = len(group)
+        if size == 0:
+            continue
+        score = 0.0
+        _, counts = np.unique(group[:, -1], return_counts=True)
+        for count in counts:
+            p = count / size
+            score += p * p
+        gini += (1.0 - score) * (size / n_instances)
+    return gini
+
+
+def test_split(index, value, dataset):
+    left = dataset[dataset[:, index] < value]
+    right = dataset[dataset[:, index] >= value]
+    return left, right
+
+
+def _split_scores(column, labels, n_classes):
+    # Sort the column once and score every distinct threshold from running
+    # class counts. Scores are accumulated in the same order as gini_index so
+    # ties resolve exactly as the exhaustive search did.
+    order = np.argsort(column, kind='stable')
+    values = column[order]
+    n_instances = len(values)
+
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    onehot = np.zeros((n_instances, n_classes), dtype=np.int64)
+    onehot[np.arange(n_instances), labels[order]] = 1
+    cumulative = np.vstack((np.zeros((1, n_classes), dtype=np.int64),
+                            np.cumsum(onehot, axis=0)))
+    totals = cumulative[-1]
+
+    left_counts = cumulative[starts]
+    right_counts = totals - left_counts
+    left_sizes = starts
+    right_sizes = n_instances - starts
+
+    gini = np.zeros(len(starts))
+    for counts, sizes in ((left_counts, left_sizes), (right_counts, right_sizes)):
+        safe_sizes = np.maximum(sizes, 1)
+        score = np.zeros(len(starts))
+        for c in range(n_classes):
+            p = counts[:, c] / safe_sizes
+            score = score + p * p
+        gini = gini + np.where(sizes > 0,
+                               (1.0 - score) * (sizes / n_instances), 0.0)
+    return gini, order[starts]
+
+
+def resolve_max_features(max_features, n_features):
+    # Number of features to try at each node: "sqrt", "log2", a count, a
+    # fraction in (0, 1], or None for all of them.
+    if max_features is None:
+        return n_features
+    if max_features == 'sqrt':
+        k = int(math.sqrt(n_features))
+    elif max_features == 'log2':
+        k = int(math.log2(n_features))
+    elif isinstance(max_features, numbers.Integral) and not isinstance(max_features, bool):
+        if max_features < 1:
+            raise ValueError(f"max_features must be at least 1, got {max_features!r}")
+        k = int(max_features)
+    elif (isinstance(max_features, numbers.Real) and not isinstance(max_features, bool)
+          and 0 < max_features <= 1):
+        k = int(max_features * n_features)
+    else:
+        raise ValueError(f"Invalid max_features: {max_features!r}")
+    return min(max(k, 1), n_features)
+
+
+def _best_split(data, rows, labels, n_classes, features=None):
+    if features is None:
+        features = range(data.shape[1] - 1)
+    best_index, best_row, best_score = 999, None, 999
+    for index in features:
+        gini, first_rows = _split_scores(data[rows, index], labels[rows], n_classes)
+        score = gini.min()
+        if score < best_score:
+            # Among equal scores the original search kept the earliest row.
+            best_row = first_rows[gini == score].min()
+            best_index, best_score = index, score
+    return best_index, data[rows[best_row], best_index]
+
+
+def _encode_labels(data):
+    _, labels = np.unique(data[:, -1], return_inverse=True)
+    labels = labels.ravel()
+    return labels, labels.max() + 1
+
+
+def get_split(dataset):
+    labels, n_classes = _encode_labels(dataset)
+    index, value = _best_split(dataset, np.arange(len(dataset)), labels, n_classes)
+    return {
+        'index': index,
+        'value': value,
+        'groups': test_split(index, value, dataset)
+    }
+
+
+def to_terminal(group):
+    outcomes = [row[-1] for row in group]
+    return Counter(outcomes).most_common(1)[0][0]
+
+
+def _terminal(data, rows, labels, n_classes):
+    # Same answer as to_terminal: ties go to the class seen first.
+    counts = np.bincount(labels[rows], minlength=n_classes)
+    first = np.argmax(counts[labels[rows]] == counts.max())
+    return data[rows[first], -1]
+
+
+def bin_features(X, max_bins=MAX_BINS):
+    # Quantize every feature once into at most max_bins small-integer bins.
+    # Bin b holds values in [edges[b], edges[b + 1]), so "bin < b" is the
+    # same test as "value < edges[b]". Columns with few distinct values
+    # (every symptom column) get one bin per value and lose nothing.
+    X = np.asarray(X)
+    binned = np.empty(X.shape, dtype=np.uint8)
+    edges = []
+    for index in range(X.shape[1]):
+        column = X[:, index]
+        feature_edges = np.unique(column)
+        if len(feature_edges) > max_bins:
+            quantiles = np.linspace(0, 1, max_bins + 1)[:-1]
+            feature_edges = np.unique(np.quantile(column, quantiles, method='lower'))
+        binned[:, index] = np.searchsorted(feature_edges, column, side='right') - 1
+        edges.append(feature_edges)
+    return binned, edges
+
+
+def _histogram(binned, rows, labels, width, n_classes):
+    n_features = binned.shape[1]
+    offsets = np.arange(n_features) * width
+    codes = (offsets + binned[rows]) * n_classes + labels[rows][:, None]
+    counts = np.bincount(codes.ravel(), minlength=n_features * width * n_classes)
+    return counts.reshape(n_features, width, n_classes)
+
+
+def _hist_best_split(hist, n_bins, features=None):
+    if features is not None:
+        index, bin_index = _hist_best_split(hist[features], n_bins[features])
+        return int(features[index]), bin_index
+    n_features, width, n_classes = hist.shape
+    cumulative = np.cumsum(hist, axis=1)
+    left_counts = cumulative - hist
+    right_counts = cumulative[:, -1:, :] - left_counts
+    left_sizes = left_counts.sum(axis=2)
+    right_sizes = right_counts.sum(axis=2)
+    n_instances = left_sizes + right_sizes
+
+    gini = np.zeros((n_features, width))
+    for counts, sizes in ((left_counts, left_sizes), (right_counts, right_sizes)):
+        safe_sizes = np.maximum(sizes, 1)
+        score = np.zeros((n_features, width))
+        for c in range(n_classes):
+            p = counts[:, :, c] / safe_sizes
+            score = score + p * p
+        gini = gini + np.where(sizes > 0,
+                               (1.0 - score) * (sizes / n_instances), 0.0)
+    gini[np.arange(width) >= n_bins[:, None]] = np.inf
+
+    index = int(np.argmin(gini.min(axis=1)))
+    return index, int(np.argmin(gini[index]))
+
+
+def build_tree(train, max_depth, min_size, indices=None, splitter='exact',
+               bins=None, max_features=None, rng=None):
+    # Nodes never copy rows: each one owns a slice [lo, hi) of a single index
+    # permutation, which is stably partitioned in place when the node splits.
+    rows = np.arange(len(train)) if indices is None else np.array(indices)
+    labels, n_classes = _encode_labels(train)
+
+    n_features = train.shape[1] - 1
+    n_candidates = resolve_max_features(max_features, n_features)
+    if n_candidates < n_features and rng is None:
+        rng = np.random.default_rng()
+
+    def candidates():
+        # Each node searches a fresh random subset of the features. Sorting
+        # keeps the scan order, so ties resolve as in the full search.
+        if n_candidates == n_features:
+            return None
+        return np.sort(rng.choice(n_features, n_candidates, replace=False))
+
+    if splitter == 'hist':
+        binned, edges = bins if bins is not None else bin_features(train[:, :-1])
+        n_bins = np.array([len(feature_edges) for feature_edges in edges])
+        width = n_bins.max()
+
+        def histogram(lo, hi):
+            return _histogram(binned, rows[lo:hi], labels, width, n_classes)
+    elif splitter != 'exact':
+        raise ValueError(f"Unknown splitter: {splitter!r}")
+
+    def split(lo, hi, hist):
+        segment = rows[lo:hi]
+        features = candidates()
+        if splitter == 'hist':
+            index, bin_index = _hist_best_split(hist, n_bins, features)
+            value = edges[index][bin_index]
+            goes_left = binned[segment, index] < bin_index
+        else:
+            index, value = _best_split(train, segment, labels, n_classes, features)
+            goes_left = train[segment, index] < value
+        rows[lo:hi] = np.concatenate((segment[goes_left], segment[~goes_left]))
+        return {'index': index, 'value': value}, lo + np.count_nonzero(goes_left)
+
+    def terminal(lo, hi):
+        return _terminal(train, rows[lo:hi], labels, n_classes)
+
+    def child_histograms(hist, lo, mid, hi):
+        # Only the smaller child is counted; its sibling is parent - child.
+        if mid - lo <= hi - mid:
+            small = histogram(lo, mid)
+            return small, hist - small
+        small = histogram(mid, hi)
+        return hist - small, small
+
+    root_hist = histogram(0, len(rows)) if splitter == 'hist' else None
+    root, mid = split(0, len(rows), root_hist)
+    stack = [(root, 0, mid, len(rows), 1, root_hist)]
+    while stack:
+        node, lo, mid, hi, depth, hist = stack.pop()
+
+        if mid == lo or mid == hi:
+            node['left'] = node['right'] = terminal(lo, hi)
+            continue
+
+        if depth >= max_depth:
+            node['left'], node['right'] = terminal(lo, mid), terminal(mid, hi)
+            continue
+
+        children = (('left', lo, mid), ('right', mid, hi))
+        child_hists = (None, None)
+        if hist is not None and any(stop - start > min_size
+                                    for _, start, stop in children):
+            child_hists = child_histograms(hist, lo, mid, hi)
+        for (side, start, stop), child_hist in zip(children, child_hists):
+            if stop - start <= min_size:
+                node[side] = terminal(start, stop)
+            else:
+                child, child_mid = split(start, stop, child_hist)
+                node[side] = child
+                stack.append((child, start, child_mid, stop, depth + 1, child_hist))
+    return root
+
+
+def predict(node, row):
+    if row[node['index']] < node['value']:
+        if isinstance(node['left'], dict):
+            return predict(node['left'], row)
+        else:
+            return node['left']
+    else:
+        if isinstance(node['right'], dict):
+            return predict(node['right'], row)
+        else:
+            return node['right']
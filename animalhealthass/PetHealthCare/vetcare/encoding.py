@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class UnknownCategoryError(ValueError):
+    def __init__(self, field, value, known):
+        self.field = field
+        self.value = value
+        super().__init__(f"Unknown {field} {value!r}. Expected one of: "
+                         f"{', '.join(known)}.")
+
+
+# Plain dict/array lookups built once from the classes of the fitted
+# LabelEncoders. They give exactly the codes LabelEncoder.transform and
+# inverse_transform would, but skip sklearn's per-call array conversion and
+# input validation.
+class FeatureEncoder:
+    def __init__(self, classes):
+        self.animals = list(classes['Animal'])
+        self.genders = list(classes['Gender'])
+        self.diseases = list(classes['Disease'])
+        self._codes = {
+            'animal': {label: code for code, label in enumerate(self.animals)},
+            'gender': {label: code for code, label in enumerate(self.genders)},
+        }
+        self._diseases = np.array(self.diseases, dtype=object)
+
+    def encode_value(self, field, value):
+        try:
+            return self._codes[field][value]
+        except (KeyError, TypeError):
+            known = self.animals if field == 'animal' else self.genders
+            raise UnknownCategoryError(field, value, known) from None
+
+    def encode(self, animal, age, gender, symptoms):
+        return ([self.encode_value('animal', animal), age,
+                 self.encode_value('gender', gender)] + list(symptoms))
+
+    def encode_column(self, field, values):
+        # Unknown values come back as -1 so a batch can report them per row.
+        codes = self._codes[field]
+        try:
+            table = {value: codes.get(value, -1) if isinstance(value, str) else -1
+                     for value in set(values)}
+        except TypeError:  # unhashable values can never match
+            return np.fromiter((codes.get(value, -1) if isinstance(value, str) else -1
+                                for value in values), dtype=np.int64, count=len(values))
+        return np.fromiter(map(table.__getitem__, values), dtype=np.int64,
+                           count=len(values))
+
+    def decode(self, code):
+        return self.diseases[int(code)]
+
+    def decode_batch(self, codes):
+        return self._diseases[np.asarray(codes, dtype=np.intp)]
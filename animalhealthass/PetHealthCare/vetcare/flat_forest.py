@@ -0,0 +1,117 @@
+import numpy as np
+
+
+# A forest stored as contiguous node arrays. Leaves point back at themselves,
+# so walking `depth` steps from any root always ends on a leaf whose
+# `leaf_class` is that tree's prediction.
+class FlatForest:
+    def __init__(self, feature, threshold, left, right, leaf_class, roots,
+                 depth, n_classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_class = leaf_class
+        self.roots = roots
+        self.depth = depth
+        self.n_classes = n_classes
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+
+# Dict trees only hold the classes their leaves happen to predict, so the
+# class count has to come from the training labels.
+def compile_forest(trees, n_classes=None):
+    if isinstance(trees, FlatForest):
+        return trees
+    if n_classes is None:
+        raise ValueError('n_classes is required to compile dict trees')
+
+    feature, threshold, left, right, leaf_class, roots = [], [], [], [], [], []
+    max_depth = 0
+
+    def add_node():
+        feature.append(0)
+        threshold.append(0.0)
+        left.append(-1)
+        right.append(-1)
+        leaf_class.append(-1)
+        return len(feature) - 1
+
+    for tree in trees:
+        root = add_node()
+        roots.append(root)
+        stack = [(tree, root, 0)]
+        while stack:
+            node, slot, depth = stack.pop()
+            if isinstance(node, dict):
+                feature[slot] = int(node['index'])
+                threshold[slot] = float(node['value'])
+                left[slot] = add_node()
+                right[slot] = add_node()
+                stack.append((node['right'], right[slot], depth + 1))
+                stack.append((node['left'], left[slot], depth + 1))
+            else:
+                left[slot] = right[slot] = slot
+                leaf_class[slot] = int(node)
+                max_depth = max(max_depth, depth)
+
+    leaf_class = np.asarray(leaf_class, dtype=np.int32)
+    if leaf_class.max() >= n_classes:
+        raise ValueError(f'leaf class {leaf_class.max()} out of range for {n_classes} classes')
+    return FlatForest(np.asarray(feature, dtype=np.int32),
+                      np.asarray(threshold, dtype=np.float64),
+                      np.asarray(left, dtype=np.int32),
+                      np.asarray(right, dtype=np.int32),
+                      leaf_class,
+                      np.asarray(roots, dtype=np.int32),
+                      max_depth,
+                      n_classes)
+
+
+def tree_predictions(forest, X, chunk_size=65536, n_classes=None):
+    forest = compile_forest(forest, n_classes)
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    out = np.empty((len(X), forest.n_trees), dtype=np.int32)
+    for start in range(0, len(X), chunk_size):
+        block = X[start:start + chunk_size]
+        rows = np.arange(len(block))[:, None]
+        node = np.tile(forest.roots, (len(block), 1))
+        for _ in range(forest.depth):
+            go_left = block[rows, forest.feature[node]] < forest.threshold[node]
+            node = np.where(go_left, forest.left[node], forest.right[node])
+        out[start:start + chunk_size] = forest.leaf_class[node]
+    return out
+
+
+def count_votes(predictions, n_classes):
+    n_rows = len(predictions)
+    flat = (np.arange(n_rows)[:, None] * n_classes + predictions).ravel()
+    votes = np.bincount(flat, minlength=n_rows * n_classes)
+    return votes.reshape(n_rows, n_classes).astype(np.int32)
+
+
+def majority_vote(predictions, votes):
+    # Counter.most_common breaks ties by first appearance, so among the
+    # classes with the top count pick the one voted for by the earliest tree.
+    rows = np.arange(len(predictions))
+    top = votes.max(axis=1)
+    is_top = votes[rows[:, None], predictions] == top[:, None]
+    return predictions[rows, is_top.argmax(axis=1)]
+
+
+def predict_batch(forest, X, n_classes=None):
+    forest = compile_forest(forest, n_classes)
+    return count_votes(tree_predictions(forest, X), forest.n_classes)
+
+
+def predict_labels(forest, X, n_classes=None):
+    forest = compile_forest(forest, n_classes)
+    predictions = tree_predictions(forest, X)
+    return majority_vote(predictions, count_votes(predictions, forest.n_classes))
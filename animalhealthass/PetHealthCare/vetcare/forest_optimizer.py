@@ -0,0 +1,171 @@
+import numpy as np
+
+from flat_forest import FlatForest, compile_forest
+
+# Post-training simplification of the dict trees built by random_forest.
+# Every rewrite leaves each tree's prediction unchanged for every input
+# (NaN included), so forest votes stay bit-identical:
+#
+# - a split whose test is already decided by an earlier test on the same
+#   feature along the path is replaced by the branch that is always taken;
+# - a split whose two branches are identical is replaced by that branch,
+#   which covers the "left = right = same leaf" nodes;
+# - identical subtrees anywhere in the forest are hash-consed into a single
+#   shared node, so the flat node pool stores each one once.
+
+
+class _Pool:
+    def __init__(self):
+        self.nodes = {}
+        self.stats = {'decided_tests': 0, 'folded_splits': 0, 'shared_subtrees': 0}
+
+    def intern(self, key, node):
+        existing = self.nodes.get(key)
+        if existing is not None:
+            if key[0] == 'split':
+                self.stats['shared_subtrees'] += 1
+            return existing
+        self.nodes[key] = node
+        return node
+
+
+def _key(node):
+    if isinstance(node, dict):
+        return ('split', node['index'], float(node['value']),
+                id(node['left']), id(node['right']))
+    return ('leaf', node)
+
+
+def _decide(node, lower, upper, pool):
+    # Follows tests on this path that earlier tests have already decided.
+    while isinstance(node, dict):
+        index, value = node['index'], node['value']
+        if index in lower and value <= lower[index]:
+            node = node['right']
+        elif index in upper and value >= upper[index]:
+            node = node['left']
+        else:
+            break
+        pool.stats['decided_tests'] += 1
+    return node
+
+
+def _simplify(root, pool):
+    # Post-order walk on an explicit stack, as in build_tree and
+    # compile_forest, so arbitrarily deep trees do not hit the recursion
+    # limit. lower[f] / upper[f]: on this path x[f] >= lower[f] (or is NaN)
+    # and x[f] < upper[f], from the earlier tests on f. Children are interned
+    # before their parent, and each finished subtree is pushed on done.
+    done = []
+    stack = [(root, {}, {}, False)]
+    while stack:
+        node, lower, upper, expanded = stack.pop()
+        if not expanded:
+            node = _decide(node, lower, upper, pool)
+            if not isinstance(node, dict):
+                done.append(pool.intern(_key(node), node))
+                continue
+            index, value = node['index'], node['value']
+            stack.append((node, lower, upper, True))
+            stack.append((node['right'], {**lower, index: value}, upper, False))
+            stack.append((node['left'], lower, {**upper, index: value}, False))
+            continue
+
+        right = done.pop()
+        left = done.pop()
+        if left is right:
+            pool.stats['folded_splits'] += 1
+            done.append(left)
+            continue
+        simplified = {'index': node['index'], 'value': node['value'],
+                      'left': left, 'right': right}
+        done.append(pool.intern(_key(simplified), simplified))
+    return done[0]
+
+
+def optimize_trees(trees):
+    # Returns the simplified trees, which share identical subtrees, and
+    # counts of each rewrite applied.
+    pool = _Pool()
+    optimized = [_simplify(tree, pool) for tree in trees]
+    return optimized, pool
+
+
+def pooled_forest(optimized, pool, n_classes):
+    # A FlatForest over optimize_trees' shared node pool, storing every
+    # shared subtree once.
+    *arrays, depth = _flatten(optimized, pool)
+    return FlatForest(*arrays, depth, n_classes)
+
+
+def _flatten(roots, pool):
+    # Pool entries were interned children first, so every node's children
+    # already have a slot when the node itself is placed.
+    slots = {}
+    feature, threshold, left, right, leaf_class, height = [], [], [], [], [], []
+    for key, node in pool.nodes.items():
+        slot = slots[id(node)] = len(feature)
+        if isinstance(node, dict):
+            l, r = slots[id(node['left'])], slots[id(node['right'])]
+            feature.append(int(node['index']))
+            threshold.append(float(node['value']))
+            left.append(l)
+            right.append(r)
+            leaf_class.append(-1)
+            height.append(1 + max(height[l], height[r]))
+        else:
+            feature.append(0)
+            threshold.append(0.0)
+            left.append(slot)
+            right.append(slot)
+            leaf_class.append(int(node))
+            height.append(0)
+    root_slots = [slots[id(root)] for root in roots]
+    return (np.asarray(feature, dtype=np.int32), np.asarray(threshold, dtype=np.float64),
+            np.asarray(left, dtype=np.int32), np.asarray(right, dtype=np.int32),
+            np.asarray(leaf_class, dtype=np.int32), np.asarray(root_slots, dtype=np.int32),
+            max(height[slot] for slot in root_slots))
+
+
+def path_length(forest, X=None):
+    # Mean number of comparisons per tree of a FlatForest: over the rows of
+    # X when given, otherwise over every root-to-leaf path.
+    is_leaf = forest.left == np.arange(forest.n_nodes)
+    if X is None:
+        total, count = 0, 0
+        stack = [(root, 0) for root in forest.roots.tolist()]
+        while stack:
+            node, depth = stack.pop()
+            if is_leaf[node]:
+                total, count = total + depth, count + 1
+            else:
+                stack.append((int(forest.left[node]), depth + 1))
+                stack.append((int(forest.right[node]), depth + 1))
+        return total / count
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    rows = np.arange(len(X))[:, None]
+    node = np.tile(forest.roots, (len(X), 1))
+    steps = np.zeros(node.shape, dtype=np.int64)
+    for _ in range(forest.depth):
+        steps += ~is_leaf[node]
+        go_left = X[rows, forest.feature[node]] < forest.threshold[node]
+        node = np.where(go_left, forest.left[node], forest.right[node])
+    return float(steps.mean())
+
+
+def optimize_forest(trees, n_classes, X=None):
+    # Returns a FlatForest over the shared node pool and a report of the
+    # reduction. X, usually the training features, weights the average
+    # path length by how often each path is taken.
+    before = compile_forest(trees, n_classes)
+    optimized, pool = optimize_trees(trees)
+    forest = pooled_forest(optimized, pool, n_classes)
+    report = dict(pool.stats,
+                  trees=before.n_trees,
+                  nodes_before=before.n_nodes,
+                  nodes_after=forest.n_nodes,
+                  depth_before=before.depth,
+                  depth_after=forest.depth,
+                  path_length_before=path_length(before, X),
+                  path_length_after=path_length(forest, X))
+    return forest, report
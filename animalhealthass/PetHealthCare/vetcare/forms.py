@@ -0,0 +1,29 @@
+from flask_wtf import FlaskForm
+from wtforms import StringField, PasswordField, SubmitField
+from wtforms.validators import InputRequired, Email, Length, EqualTo, ValidationError
+
+from models import User
+
+
+class RegisterForm(FlaskForm):
+    email = StringField(validators=[InputRequired(), Email(), Length(max=150)],
+                        render_kw={"placeholder": "Email"})
+    password = PasswordField(validators=[InputRequired(), Length(min=8, max=100)],
+                             render_kw={"placeholder": "Password"})
+    confirm_password = PasswordField(validators=[InputRequired(), EqualTo('password')],
+                                     render_kw={"placeholder": "Confirm Password"})
+    submit = SubmitField('Register')
+
+    def validate_email(self, email):
+        user = User.query.filter_by(email=email.data).first()
+        if user:
+            raise ValidationError(
+                'Email already registered. Please use a different one.')
+
+
+class LoginForm(FlaskForm):
+    email = StringField(validators=[InputRequired(), Email(), Length(max=150)],
+                        render_kw={"placeholder": "Email"})
+    password = PasswordField(validators=[InputRequired(), Length(min=8, max=100)],
+                             render_kw={"placeholder": "Password"})
+    submit = SubmitField('Login')
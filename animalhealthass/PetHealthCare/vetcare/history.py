@@ -0,0 +1,125 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+# Write-behind queue for prediction history. Requests only enqueue a row;
+# a background thread inserts rows in one executemany transaction once
+# batch_size rows are waiting or flush_interval seconds have passed. If the
+# queue is full, rows are dropped and counted rather than slowing requests.
+class HistoryWriter:
+    def __init__(self, app, db, table, batch_size=500, flush_interval=1.0,
+                 max_queue=100000):
+        self.app = app
+        self.db = db
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def record(self, rows):
+        self._ensure_started()
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                metrics.inc('vetcare_history_dropped_total')
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='history-writer',
+                                                daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def close(self, timeout=10.0):
+        # Flushes everything still queued before returning.
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), self.batch_size):
+            self._write(batch[start:start + self.batch_size])
+
+    def _insert(self, rows):
+        with self.app.app_context():
+            with self.db.engine.begin() as connection:
+                connection.execute(self.table.insert(), rows)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            self._insert(batch)
+        except Exception:
+            if len(batch) == 1:
+                logger.exception('Failed to write a prediction history row')
+                metrics.inc('vetcare_history_dropped_total')
+                return
+            # One bad row fails the whole executemany; retry row by row so
+            # only the rows that fail on their own are dropped, and log the
+            # batch once however many of them do.
+            written = 0
+            for row in batch:
+                try:
+                    self._insert([row])
+                except Exception:
+                    pass
+                else:
+                    written += 1
+            logger.exception('Batch of %d prediction history rows failed; dropped %d',
+                             len(batch), len(batch) - written)
+            metrics.inc('vetcare_history_dropped_total', len(batch) - written)
+            metrics.inc('vetcare_history_rows_total', written)
+            return
+        metrics.observe('vetcare_history_flush_seconds', time.perf_counter() - start)
+        metrics.inc('vetcare_history_rows_total', len(batch))
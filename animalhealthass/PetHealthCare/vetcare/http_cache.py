@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, current_app, jsonify, request
+from werkzeug.http import quote_etag
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+# Responses smaller than this gain little from compression.
+COMPRESS_MIN_SIZE = 1024
+# Static files above this size are served from disk rather than memory.
+STATIC_MAX_BYTES = 1 << 20
+
+
+def compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES)
+
+
+def encodings():
+    # Content codings this server can produce, most preferred first.
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(body, encoding, best=False):
+    # best is for payloads compressed once at startup; per-response
+    # compression uses faster settings.
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if best else 5)
+    # mtime=0 keeps the output, and so the ETag, identical across workers.
+    return gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+
+
+def choose_encoding(available):
+    # The first coding the client accepts, in server preference order, or
+    # None for the identity body.
+    accepted = request.accept_encodings
+    for encoding in available:
+        if accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+# A response whose bytes never change while the process runs, serialized,
+# hashed and compressed once. Each content coding is its own representation
+# with its own strong ETag, as RFC 9110 requires.
+class CachedResponse:
+    def __init__(self, body, mimetype, cache_control, min_size=COMPRESS_MIN_SIZE):
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        variants = {None: (body, etag)}
+        if compressible(mimetype) and len(body) >= min_size:
+            for encoding in encodings():
+                compressed = compress(body, encoding, best=True)
+                if len(compressed) < len(body):
+                    variants[encoding] = (compressed, f'{etag}-{encoding}')
+        self.encodings = [encoding for encoding in variants if encoding is not None]
+
+        # Header lists are built once; a request only picks a variant.
+        self.variants = {}
+        for encoding, (body, etag) in variants.items():
+            headers = [('ETag', quote_etag(etag)), ('Cache-Control', cache_control)]
+            if self.encodings:
+                headers.append(('Vary', 'Accept-Encoding'))
+            full = headers + ([('Content-Encoding', encoding)] if encoding else [])
+            self.variants[encoding] = (body, etag, full, headers)
+
+    def response(self):
+        encoding = choose_encoding(self.encodings) if self.encodings else None
+        body, etag, headers, not_modified = self.variants[encoding]
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=not_modified)
+        return Response(body, headers=headers, mimetype=self.mimetype)
+
+
+# Prebuilt responses for the reference routes (/options, /medication) and the
+# files under static/, keyed by the caller.
+class ResponseCache:
+    def __init__(self, max_age=300, static_max_age=3600, min_size=COMPRESS_MIN_SIZE):
+        self.max_age = max_age
+        self.static_max_age = static_max_age
+        self.min_size = min_size
+        self.entries = {}
+
+    def add(self, key, body, mimetype, max_age=None):
+        max_age = self.max_age if max_age is None else max_age
+        self.entries[key] = CachedResponse(body, mimetype, f'public, max-age={max_age}',
+                                           self.min_size)
+        return self.entries[key]
+
+    def add_json(self, app, key, payload):
+        # Same bytes as jsonify(payload) would produce on every request.
+        with app.app_context():
+            body = jsonify(payload).get_data()
+        return self.add(key, body, 'application/json')
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def load_static(self, folder):
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.getsize(path) > STATIC_MAX_BYTES:
+                    continue
+                filename = os.path.relpath(path, folder).replace(os.sep, '/')
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                with open(path, 'rb') as f:
+                    self.add(('static', filename), f.read(), mimetype, self.static_max_age)
+
+    def size(self):
+        return sum(len(variant[0]) for entry in self.entries.values()
+                   for variant in entry.variants.values())
+
+
+def send_static(filename):
+    # Replaces Flask's static view. Files added after startup, or too large
+    # to keep in memory, fall back to send_static_file.
+    cached = current_app.extensions['response_cache'].get(('static', filename))
+    if cached is None:
+        return current_app.send_static_file(filename)
+    return cached.response()
+
+
+def compress_response(response):
+    # after_request hook for dynamic text responses such as rendered
+    # templates. Only endpoints in COMPRESS_ENDPOINTS are compressed: a page
+    # that reflects request input next to a secret such as the login and
+    # register forms' CSRF token would let the compressed length leak the
+    # secret (BREACH). Streamed bodies and files are left alone, and the
+    # cheap checks come first since most API responses are short.
+    if (request.endpoint not in current_app.config['COMPRESS_ENDPOINTS']
+            or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or response.calculate_content_length() < current_app.config['COMPRESS_MIN_SIZE']
+            or 'Content-Encoding' in response.headers
+            or not compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(encodings())
+    if encoding is None:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
@@ -1,25 +1,9 @@
-from random_forest import bagging_predict
-import numpy as np
-import pandas as pd
-from utils import load_and_prepare_data
-from random_forest import random_forest
-
-# Load and prepare data
-data, encoders = load_and_prepare_data('animal_health_dataset.csv')
-X, y = data[:, :-1], data[:, -1]
-train = np.column_stack((X, y))
-
-# Train the Random Forest and get trees
-n_trees = 10
-max_depth = 5
-min_size = 5
-sample_size = 0.8
-trees = random_forest(train, X, max_depth, min_size, sample_size, n_trees)
-
-# Get encoders
-animal_encoder = encoders['Animal']
-gender_encoder = encoders['Gender']
-disease_encoder = encoders['Disease']
+import argparse
+import sys
+
+from model_store import load_or_train
+from prediction_table import build_table
+from encoding import FeatureEncoder
 
 # Medication mapping with available products in India
 medication_mapping = {
@@ -70,65 +54,112 @@ medication_mapping = {
     }
 }
 
-# Prompt user for input
-print("\nAnimal Health Prediction System")
-print("Select Animal:")
-for i, label in enumerate(animal_encoder.classes_):
-    print(f"{i + 1}. {label}")
-animal_input = int(input("Enter the number: ")) - 1
-animal_encoded = animal_encoder.transform([animal_encoder.classes_[animal_input]])[0]
-
-age = float(input("Enter age: "))
-
-print("\nSelect Gender:")
-for i, label in enumerate(gender_encoder.classes_):
-    print(f"{i + 1}. {label}")
-gender_input = int(input("Enter the number: ")) - 1
-gender_encoded = gender_encoder.transform([gender_encoder.classes_[gender_input]])[0]
-
-print("\nEnter symptoms (1 = Yes, 0 = No):")
-fever = int(input("Fever: "))
-cough = int(input("Cough: "))
-vomiting = int(input("Vomiting: "))
-diarrhea = int(input("Diarrhea: "))
-lethargy = int(input("Lethargy: "))
-appetite = int(input("Loss of Appetite: "))
-sneezing = int(input("Sneezing: "))
-rash = int(input("Skin Rash: "))
-
-# Collect symptoms
-symptoms = [fever, cough, vomiting, diarrhea, lethargy, appetite, sneezing, rash]
-
-if all(symptom == 0 for symptom in symptoms):
-    predicted_disease = "Healthy"
-    medication_info = {
-        'description': 'No medication required. Maintain good nutrition and regular check-ups.',
-        'products': []
-    }
-else:
-    # Create test sample and predict
-    sample = [animal_encoded, age, gender_encoded, fever, cough, vomiting,
-              diarrhea, lethargy, appetite, sneezing, rash]
-    prediction = bagging_predict(trees, sample)
-    predicted_disease = disease_encoder.inverse_transform([int(prediction)])[0]
-    medication_info = medication_mapping.get(predicted_disease, {
-        'description': 'Consult a veterinarian for appropriate medication.',
-        'products': []
-    })
-
-# Output
-print("\nPredicted Disease:", predicted_disease)
-# Ask if the user wants to see the recommended treatment
-show_treatment = input("\nWould you like to see the recommended treatment and medications? (1 = Yes, 0 = No): ")
-
-if show_treatment.strip() == '1':
-    treatment_info = medication_mapping.get(predicted_disease)
-    if treatment_info:
-        print("\nRecommended Treatment:", treatment_info['description'])
-        print("Available Medications:")
-        for med in treatment_info['products']:
-            print(f"- {med['name']}: {med['link']}")
+
+def interactive(feature_encoder, prediction_table):
+    # Prompt user for input
+    print("\nAnimal Health Prediction System")
+    print("Select Animal:")
+    for i, label in enumerate(feature_encoder.animals):
+        print(f"{i + 1}. {label}")
+    animal_input = int(input("Enter the number: ")) - 1
+    animal_encoded = feature_encoder.encode_value('animal', feature_encoder.animals[animal_input])
+
+    age = float(input("Enter age: "))
+
+    print("\nSelect Gender:")
+    for i, label in enumerate(feature_encoder.genders):
+        print(f"{i + 1}. {label}")
+    gender_input = int(input("Enter the number: ")) - 1
+    gender_encoded = feature_encoder.encode_value('gender', feature_encoder.genders[gender_input])
+
+    print("\nEnter symptoms (1 = Yes, 0 = No):")
+    fever = int(input("Fever: "))
+    cough = int(input("Cough: "))
+    vomiting = int(input("Vomiting: "))
+    diarrhea = int(input("Diarrhea: "))
+    lethargy = int(input("Lethargy: "))
+    appetite = int(input("Loss of Appetite: "))
+    sneezing = int(input("Sneezing: "))
+    rash = int(input("Skin Rash: "))
+
+    # Collect symptoms
+    symptoms = [fever, cough, vomiting, diarrhea, lethargy, appetite, sneezing, rash]
+
+    if all(symptom == 0 for symptom in symptoms):
+        predicted_disease = "Healthy"
+        medication_info = {
+            'description': 'No medication required. Maintain good nutrition and regular check-ups.',
+            'products': []
+        }
+    else:
+        # Create test sample and predict
+        sample = [animal_encoded, age, gender_encoded, fever, cough, vomiting,
+                  diarrhea, lethargy, appetite, sneezing, rash]
+        prediction = prediction_table.predict(sample)
+        predicted_disease = feature_encoder.decode(prediction)
+        medication_info = medication_mapping.get(predicted_disease, {
+            'description': 'Consult a veterinarian for appropriate medication.',
+            'products': []
+        })
+
+    # Output
+    print("\nPredicted Disease:", predicted_disease)
+    # Ask if the user wants to see the recommended treatment
+    show_treatment = input("\nWould you like to see the recommended treatment and medications? (1 = Yes, 0 = No): ")
+
+    if show_treatment.strip() == '1':
+        treatment_info = medication_mapping.get(predicted_disease)
+        if treatment_info:
+            print("\nRecommended Treatment:", treatment_info['description'])
+            print("Available Medications:")
+            for med in treatment_info['products']:
+                print(f"- {med['name']}: {med['link']}")
+        else:
+            print("\nNo specific medications found. Please consult a veterinarian.")
+    else:
+        print("\nThank you for using the Animal Health Prediction System!")
+
+
+def batch(args, feature_encoder, prediction_table):
+    from batch_scoring import BatchScorer, score_stream
+
+    scorer = BatchScorer(feature_encoder, prediction_table, medication_mapping,
+                         args.format)
+    source = sys.stdin if args.input == '-' else open(args.input, newline='')
+    out = sys.stdout if args.output in (None, '-') else open(args.output, 'w', newline='')
+    try:
+        n_rows = score_stream(source, out, scorer, args.chunk_size, args.jobs)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"Scored {n_rows} cases.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Animal Health Prediction System')
+    parser.add_argument('--input', help="CSV or NDJSON file of cases to score ('-' for stdin); "
+                                        "without it the cases are entered interactively")
+    parser.add_argument('--output', help='write results here instead of stdout')
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson',
+                        help='output format')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='worker processes for large inputs (-1 for all cores)')
+    args = parser.parse_args()
+
+    # Load the saved forest, training it only if the artifact is missing or stale
+    trees, classes, model_manifest = load_or_train()
+
+    # Get encoders
+    feature_encoder = FeatureEncoder(classes)
+
+    # Precompute the forest's answer for every possible input
+    prediction_table = build_table(trees, len(feature_encoder.animals),
+                                   len(feature_encoder.genders))
+
+    if args.input:
+        batch(args, feature_encoder, prediction_table)
     else:
-        print("\nNo specific medications found. Please consult a veterinarian.")
-else:
-    print("\nThank you for using the Animal Health Prediction System!")
\ No newline at end of file
+        interactive(feature_encoder, prediction_table)
@@ -0,0 +1,242 @@
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, n_buckets):
+        self.counts = [0] * (n_buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class _Timer:
+    __slots__ = ('record', 'name', 'labels', 'start')
+
+    def __init__(self, record, name, labels):
+        self.record = record
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.record(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+# Counters, gauges and latency histograms rendered in the Prometheus text
+# exposition format. Updates take one short lock, so recording a stage costs
+# a couple of microseconds.
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.enabled = True
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._buckets = {}
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, text, buckets=None):
+        self._help[name] = (kind, text)
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._buckets.get(name, self.buckets)
+        bucket = bisect_left(buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(buckets))
+            histogram.counts[bucket] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def time(self, name, **labels):
+        if not self.enabled:
+            return _NOOP_TIMER
+        return _Timer(self.observe, name, labels)
+
+    def time_gauge(self, name, **labels):
+        return _Timer(self.set_gauge, name, labels)
+
+    def stage(self, stage):
+        return self.time('vetcare_stage_seconds', stage=stage)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(h.counts), h.sum, h.count)
+                          for key, h in self._histograms.items()}
+
+        lines, seen = [], set()
+
+        def header(name, default_kind):
+            if name in seen:
+                return
+            seen.add(name)
+            kind, text = self._help.get(name, (default_kind, ''))
+            if text:
+                lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, 'gauge')
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            buckets = self._buckets.get(name, self.buckets)
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                bucket_labels = labels + (('le', le),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.9g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"'
+                          for (key, _), value in zip(labels, escaped)) + '}'
+
+
+# Statistical profiler: a daemon thread snapshots every other thread's stack
+# at a fixed interval and counts the collapsed stacks, which can be fed
+# straight into flamegraph.pl or speedscope.
+class SamplingProfiler:
+    # Shorter intervals would have the sampler thread starve the workers.
+    MIN_INTERVAL = 0.001
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        if self.running:
+            return
+        if interval:
+            self.interval = max(interval, self.MIN_INTERVAL)
+        self.samples = Counter()
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n"
+                       for stack, count in self.samples.most_common())
+
+
+metrics = Metrics()
+profiler = SamplingProfiler()
+
+metrics.describe('vetcare_stage_seconds', 'histogram',
+                 'Time spent in each stage of request handling.')
+metrics.describe('vetcare_request_seconds', 'histogram',
+                 'End-to-end request latency per route.')
+metrics.describe('vetcare_requests_total', 'counter',
+                 'Requests handled per route and status code.')
+metrics.describe('vetcare_predictions_total', 'counter',
+                 'Cases scored by the model.')
+metrics.describe('vetcare_training_phase_seconds', 'gauge',
+                 'Duration of each phase of the last model load or training run.')
+metrics.describe('vetcare_model_version', 'gauge',
+                 'Version of the model artifact currently being served.')
+metrics.describe('vetcare_forest_nodes', 'gauge',
+                 'Nodes in the last trained forest, before and after optimization.')
+metrics.describe('vetcare_forest_path_length', 'gauge',
+                 'Mean comparisons per tree on training rows, before and after optimization.')
+metrics.describe('vetcare_predict_batch_size', 'histogram',
+                 'Cases per micro-batch run by the /predict scheduler.', SIZE_BUCKETS)
+metrics.describe('vetcare_predict_batch_wait_seconds', 'histogram',
+                 'Time the oldest case in a micro-batch waited before it ran.')
+metrics.describe('vetcare_predict_queue_depth', 'gauge',
+                 'Cases left queued when the scheduler closed its last batch.')
+metrics.describe('vetcare_startup_phase_seconds', 'gauge',
+                 'Duration of each application startup phase.')
+metrics.describe('vetcare_history_rows_total', 'counter',
+                 'Prediction history rows written to the database.')
+metrics.describe('vetcare_history_dropped_total', 'counter',
+                 'Prediction history rows dropped because the queue was full or a write failed.')
+metrics.describe('vetcare_history_flush_seconds', 'histogram',
+                 'Time spent writing one batch of prediction history.')
@@ -0,0 +1,219 @@
+import logging
+import os
+import threading
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Everything a request needs to score a case. A bundle is never mutated
+# after it is built, so swapping in a new one is a single reference
+# assignment and requests holding the old bundle finish on it unaffected.
+class LoadedModel:
+    def __init__(self, forest, classes, manifest, feature_encoder, prediction_table):
+        self.forest = forest
+        self.classes = classes
+        self.manifest = manifest
+        self.feature_encoder = feature_encoder
+        self.prediction_table = prediction_table
+
+    @property
+    def version(self):
+        return self.manifest.get('version')
+
+
+# Loads the model on first use (or on an explicit warm-up) instead of at
+# import time, so the web process can serve requests that do not touch the
+# model while numpy and the artifact are still being loaded. It can also
+# retrain in the background and hot-swap the result, and picks up artifacts
+# written by other processes every reload_interval seconds.
+class ModelService:
+    def __init__(self, dataset_path=None, model_dir=None, params=None,
+                 reload_interval=5.0):
+        self.dataset_path = dataset_path
+        self.model_dir = model_dir
+        self.params = params
+        self.reload_interval = reload_interval
+        self.timings = {}
+        self.retrain_status = {'state': 'idle'}
+        self._model = None
+        self._lock = threading.Lock()
+        self._retrain_lock = threading.Lock()
+        self._preload_thread = None
+        self._next_reload_check = 0.0
+        self._manifest_mtime = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def get(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+                    self._manifest_mtime = self._read_manifest_mtime()
+                model = self._model
+        elif self.reload_interval and time.monotonic() >= self._next_reload_check:
+            model = self._maybe_reload()
+        return model
+
+    def preload(self, background=True):
+        if not background:
+            return self.get()
+        if self._preload_thread is None:
+            self._preload_thread = threading.Thread(target=self.get,
+                                                    name='model-preload', daemon=True)
+            self._preload_thread.start()
+        return None
+
+    def _store_paths(self):
+        import model_store
+
+        return (self.dataset_path or model_store.DATASET_PATH,
+                self.model_dir or model_store.MODEL_DIR)
+
+    def _phase(self, name, start):
+        elapsed = time.perf_counter() - start
+        self.timings[name] = elapsed
+        metrics.set_gauge('vetcare_startup_phase_seconds', elapsed, phase=name)
+        return time.perf_counter()
+
+    def _load(self):
+        start = time.perf_counter()
+        import model_store
+        start = self._phase('import_ml', start)
+
+        dataset_path, model_dir = self._store_paths()
+        forest, classes, manifest = model_store.load_or_train(
+            dataset_path, model_dir, self.params)
+        start = self._phase('load_model', start)
+
+        model = self._build(forest, classes, manifest)
+        self._phase('build_table', start)
+        return model
+
+    def _build(self, forest, classes, manifest):
+        from encoding import FeatureEncoder
+        from prediction_table import build_table, verify_table
+
+        feature_encoder = FeatureEncoder(classes)
+        # Every input except age is categorical, so the forest's answers are
+        # compiled into a lookup table once and requests are served with a
+        # single index.
+        prediction_table = build_table(forest, len(feature_encoder.animals),
+                                       len(feature_encoder.genders))
+        if not verify_table(prediction_table):
+            raise RuntimeError('Compiled prediction table disagrees with the forest.')
+        metrics.set_gauge('vetcare_training_phase_seconds',
+                          prediction_table.build_seconds, phase='build_table')
+        if manifest.get('version') is not None:
+            metrics.set_gauge('vetcare_model_version', manifest['version'])
+        return LoadedModel(forest, classes, manifest, feature_encoder, prediction_table)
+
+    def _swap(self, model):
+        self._model = model
+        logger.info('Serving model version %s', model.version)
+
+    # --------------------- Reloading ---------------------
+
+    def _read_manifest_mtime(self):
+        try:
+            return os.stat(os.path.join(self._store_paths()[1], 'manifest.json')).st_mtime_ns
+        except OSError:
+            return None
+
+    def _maybe_reload(self):
+        self._next_reload_check = time.monotonic() + self.reload_interval
+        mtime = self._read_manifest_mtime()
+        if mtime is None or mtime == self._manifest_mtime:
+            return self._model
+
+        import model_store
+
+        with self._lock:
+            self._manifest_mtime = mtime
+            current = self._model
+            loaded = model_store.load_model(self._store_paths()[1])
+            if loaded is None or loaded[2]['checksum'] == current.manifest.get('checksum'):
+                return current
+            self._swap(self._build(*loaded))
+            return self._model
+
+    # --------------------- Retraining ---------------------
+
+    def retrain(self, n_jobs=1, min_accuracy=0.1, tolerance=0.02,
+                validation_fraction=0.2, background=True):
+        # Returns False if a retrain is already running.
+        if not self._retrain_lock.acquire(blocking=False):
+            return False
+        self.retrain_status = {'state': 'running', 'started_at': time.time()}
+        args = (n_jobs, min_accuracy, tolerance, validation_fraction)
+        if background:
+            threading.Thread(target=self._retrain, args=args, name='model-retrain',
+                             daemon=True).start()
+        else:
+            self._retrain(*args)
+        return True
+
+    def _retrain(self, n_jobs, min_accuracy, tolerance, validation_fraction):
+        status = dict(self.retrain_status)
+        try:
+            import numpy as np
+            import model_store
+            from flat_forest import predict_labels
+
+            dataset_path, model_dir = self._store_paths()
+            params = model_store.model_params(self.params)
+            source_hash = model_store.file_hash(dataset_path)
+
+            # A candidate trained on all but a held-out validation split is
+            # judged only on rows it never saw, against a fixed floor and
+            # against always answering the candidate's most common training
+            # class on those same rows. Recorded scores of earlier models
+            # are not used, so successive retrains cannot drift downwards.
+            start = time.perf_counter()
+            data, classes = model_store.load_training_data(dataset_path, source_hash,
+                                                           params['use_reservoir'])
+            train_rows, validation_rows = model_store.holdout_split(
+                len(data), validation_fraction)
+            train, validation = data[train_rows], data[validation_rows]
+            candidate, _ = model_store.fit_forest(train, classes, params, n_jobs)
+            accuracy = float(np.mean(predict_labels(candidate, validation[:, :-1])
+                                     == validation[:, -1]))
+            majority = np.bincount(train[:, -1].astype(np.int64)).argmax()
+            baseline = float(np.mean(validation[:, -1] == majority))
+            validation = {'accuracy': accuracy, 'baseline_accuracy': baseline,
+                          'rows': len(validation_rows), 'fraction': validation_fraction}
+            status['accuracy'] = accuracy
+            status['baseline_accuracy'] = baseline
+            if accuracy < max(min_accuracy, baseline - tolerance):
+                status['training_seconds'] = time.perf_counter() - start
+                status['state'] = 'rejected'
+                return
+
+            # The accepted configuration is refitted on every row, so the
+            # served forest does not lose the held-out fifth of the data.
+            forest, classes = model_store.fit_forest(data, classes, params, n_jobs)
+            training_seconds = time.perf_counter() - start
+            status['training_seconds'] = training_seconds
+
+            manifest = model_store.save_model(model_dir, forest, classes, params,
+                                              source_hash, training_seconds, validation)
+            model = self._build(model_store.load_model(model_dir)[0], classes, manifest)
+            with self._lock:
+                self._swap(model)
+                self._manifest_mtime = self._read_manifest_mtime()
+            status['state'] = 'succeeded'
+            status['version'] = manifest['version']
+        except Exception as e:
+            logger.exception('Model retraining failed')
+            status['state'] = 'failed'
+            status['error'] = str(e)
+        finally:
+            status['finished_at'] = time.time()
+            self.retrain_status = status
+            self._retrain_lock.release()
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from flat_forest import FlatForest, compile_forest
+from forest_optimizer import optimize_forest
+from metrics import metrics
+
+FORMAT_VERSION = 1
+DATASET_PATH = 'animal_health_dataset.csv'
+MODEL_DIR = os.path.join('instance', 'model')
+DEFAULT_PARAMS = {
+    'n_trees': 10,
+    'max_depth': 5,
+    'min_size': 5,
+    'sample_size': 0.8,
+    'splitter': 'exact',
+    # Features tried at each node: None (all), "sqrt", "log2", int or float.
+    'max_features': None,
+    # Train on the uniform row sample kept by `dataset_cache.py --reservoir N`
+    # instead of every row; ignored while the cache has no sample.
+    'use_reservoir': False,
+}
+# Written by tuning.py. Its values override DEFAULT_PARAMS for the web app,
+# main.py and retraining alike.
+MODEL_CONFIG_PATH = 'model_config.json'
+FOREST_ARRAYS = ('feature', 'threshold', 'left', 'right', 'leaf_class', 'roots')
+# Training rows used to measure the forest's average path length.
+PATH_SAMPLE_ROWS = 10000
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _arrays_hash(arrays):
+    digest = hashlib.sha256()
+    for name in FOREST_ARRAYS:
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()
+
+
+def read_model_config(path=MODEL_CONFIG_PATH):
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {key: value for key, value in config.get('params', {}).items()
+            if key in DEFAULT_PARAMS}
+
+
+def write_model_config(params, path=MODEL_CONFIG_PATH, **extra):
+    params = {key: value for key, value in params.items() if key in DEFAULT_PARAMS}
+    staging = path + '.tmp'
+    with open(staging, 'w') as f:
+        json.dump(dict(extra, params=params), f, indent=2)
+    os.replace(staging, path)
+
+
+def model_params(params=None):
+    # DEFAULT_PARAMS, then the tuned configuration, then explicit overrides.
+    return {**DEFAULT_PARAMS, **read_model_config(), **(params or {})}
+
+
+def fit_forest(data, classes, params=None, n_jobs=1):
+    from random_forest import random_forest
+
+    params = model_params(params)
+    X = data[:, :-1]
+    with metrics.time_gauge('vetcare_training_phase_seconds', phase='fit'):
+        trees = random_forest(data, X[:0], params['max_depth'], params['min_size'],
+                              params['sample_size'], params['n_trees'],
+                              n_jobs=n_jobs, splitter=params['splitter'],
+                              max_features=params['max_features'])
+    with metrics.time_gauge('vetcare_training_phase_seconds', phase='compile'):
+        forest, report = optimize_forest(trees, len(classes['Disease']),
+                                         X[:PATH_SAMPLE_ROWS])
+    for stage in ('before', 'after'):
+        metrics.set_gauge('vetcare_forest_nodes', report[f'nodes_{stage}'], stage=stage)
+        metrics.set_gauge('vetcare_forest_path_length', report[f'path_length_{stage}'],
+                          stage=stage)
+    return forest, classes
+
+
+def holdout_split(n_rows, fraction=0.2, seed=0):
+    # Sorted (train, validation) row indices. A fixed seed gives the same
+    # split for the same dataset, so validation scores stay comparable.
+    order = np.random.default_rng(seed).permutation(n_rows)
+    n_validation = min(max(int(round(n_rows * fraction)), 1), n_rows - 1)
+    return np.sort(order[n_validation:]), np.sort(order[:n_validation])
+
+
+def load_training_data(dataset_path=DATASET_PATH, source_hash=None, use_reservoir=False):
+    # Training reads the encoded, memory-mapped dataset cache; pandas is only
+    # imported when the cache has to be rebuilt from the CSV.
+    from dataset_cache import load_dataset
+
+    with metrics.time_gauge('vetcare_training_phase_seconds', phase='load_data'):
+        return load_dataset(dataset_path, source_hash=source_hash,
+                            use_reservoir=use_reservoir)
+
+
+def train_model(dataset_path=DATASET_PATH, params=None, n_jobs=1, source_hash=None):
+    params = model_params(params)
+    data, classes = load_training_data(dataset_path, source_hash, params['use_reservoir'])
+    return fit_forest(data, classes, params, n_jobs)
+
+
+def save_model(model_dir, forest, classes, params, source_hash,
+               training_seconds=None, validation=None):
+    forest = compile_forest(forest)
+    arrays = {name: getattr(forest, name) for name in FOREST_ARRAYS}
+    previous = read_manifest(model_dir) or {}
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'version': previous.get('version', 0) + 1,
+        'params': params,
+        'source_hash': source_hash,
+        'checksum': _arrays_hash(arrays),
+        'depth': forest.depth,
+        'n_classes': forest.n_classes,
+        'classes': classes,
+        'trained_at': time.time(),
+        'training_seconds': training_seconds,
+        'validation': validation,
+    }
+
+    # Write into a sibling directory and swap it in so readers never see a
+    # half-written artifact.
+    parent = os.path.dirname(os.path.abspath(model_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.model-')
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, name + '.npy'), array)
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    replace_directory(staging, model_dir)
+    return manifest
+
+
+def replace_directory(staging, target):
+    if os.path.isdir(target):
+        retired = staging + '.old'
+        os.replace(target, retired)
+        os.replace(staging, target)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, target)
+
+
+def read_manifest(model_dir):
+    try:
+        with open(os.path.join(model_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_model(model_dir, params=None, source_hash=None):
+    manifest = read_manifest(model_dir)
+    if manifest is None or manifest.get('format_version') != FORMAT_VERSION:
+        return None
+    if params is not None and manifest['params'] != params:
+        return None
+    if source_hash is not None and manifest['source_hash'] != source_hash:
+        return None
+
+    try:
+        # Memory-mapped arrays are backed by the page cache, so every worker
+        # process reading the same artifact shares one read-only copy.
+        arrays = {name: np.load(os.path.join(model_dir, name + '.npy'),
+                                mmap_mode='r')
+                  for name in FOREST_ARRAYS}
+    except (OSError, ValueError):
+        return None
+    if _arrays_hash(arrays) != manifest['checksum']:
+        return None
+
+    forest = FlatForest(arrays['feature'], arrays['threshold'], arrays['left'],
+                        arrays['right'], arrays['leaf_class'], arrays['roots'],
+                        manifest['depth'], manifest['n_classes'])
+    return forest, manifest['classes'], manifest
+
+
+def load_or_train(dataset_path=DATASET_PATH, model_dir=MODEL_DIR, params=None):
+    params = model_params(params)
+    start = time.perf_counter()
+    source_hash = file_hash(dataset_path)
+    loaded = load_model(model_dir, params, source_hash)
+    metrics.set_gauge('vetcare_training_phase_seconds',
+                      time.perf_counter() - start, phase='load_artifact')
+    if loaded is not None:
+        return loaded
+
+    start = time.perf_counter()
+    forest, classes = train_model(dataset_path, params, source_hash=source_hash)
+    elapsed = time.perf_counter() - start
+    try:
+        save_model(model_dir, forest, classes, params, source_hash, elapsed)
+    except OSError:
+        pass  # A read-only deployment can still serve the freshly trained forest.
+    return load_model(model_dir, params, source_hash) or (
+        forest, classes, {'params': params, 'training_seconds': elapsed})
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    params = model_params()
+    forest, classes = train_model(DATASET_PATH, params)
+    elapsed = time.perf_counter() - start
+    manifest = save_model(MODEL_DIR, forest, classes, params,
+                          file_hash(DATASET_PATH), elapsed)
+    print(f"Saved {forest.n_trees} trees ({forest.n_nodes} nodes) to {MODEL_DIR} "
+          f"in {elapsed:.2f}s, checksum {manifest['checksum'][:12]}")
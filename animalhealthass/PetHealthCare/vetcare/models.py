@@ -0,0 +1,52 @@
+import sqlite3
+
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from sqlalchemy import event
+
+db = SQLAlchemy()
+
+
+def init_database(app):
+    # Pragmas apply to this app's engine only, and tables missing from an
+    # existing database file are created before the first request.
+    with app.app_context():
+        event.listen(db.engine, 'connect', _tune_sqlite)
+        db.create_all()
+
+
+# WAL lets the history writer commit while request threads keep reading, and
+# synchronous=NORMAL is durable enough in WAL mode at a fraction of the fsyncs.
+def _tune_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-16000')
+    cursor.close()
+
+
+class User(db.Model, UserMixin):
+    __tablename__ = 'users'
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(150), nullable=False, unique=True)
+    password = db.Column(db.String(100), nullable=False)
+
+
+class Prediction(db.Model):
+    __tablename__ = 'predictions'
+    # History is paged newest-first per user by id, which this index serves
+    # directly however many rows the table holds.
+    __table_args__ = (db.Index('ix_predictions_user_id_id', 'user_id', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+    source = db.Column(db.String(20), nullable=False)
+    animal = db.Column(db.String(50))
+    age = db.Column(db.Float)
+    gender = db.Column(db.String(20))
+    symptoms = db.Column(db.Integer, nullable=False)  # bit i = SYMPTOM_FIELDS[i]
+    disease = db.Column(db.String(100), nullable=False)
@@ -0,0 +1,127 @@
+import time
+from bisect import bisect_right
+
+import numpy as np
+
+from flat_forest import compile_forest, predict_labels
+
+# Feature layout used by the model: animal, age, gender, then the symptoms.
+ANIMAL, AGE, GENDER = 0, 1, 2
+N_SYMPTOMS = 8
+
+
+# Every (animal, gender, symptom bitmask, age interval) cell of the input
+# space with the forest's answer for it. Age only matters through which side
+# of each age threshold in the forest it falls, so one representative age per
+# interval between consecutive thresholds covers every possible age.
+class PredictionTable:
+    def __init__(self, forest, table, age_thresholds, build_seconds):
+        self.forest = forest
+        self.table = table
+        self.age_thresholds = age_thresholds
+        self._thresholds = age_thresholds.tolist()
+        self._weights = 1 << np.arange(N_SYMPTOMS)
+        self.build_seconds = build_seconds
+
+    @property
+    def n_cells(self):
+        return self.table.size
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def info(self):
+        return {
+            'shape': list(self.table.shape),
+            'cells': int(self.n_cells),
+            'bytes': int(self.nbytes),
+            'age_thresholds': len(self._thresholds),
+            'build_seconds': round(self.build_seconds, 6),
+        }
+
+    def lookup(self, animal, gender, symptoms, age):
+        n_animals, n_genders = self.table.shape[:2]
+        if not (0 <= animal < n_animals and 0 <= gender < n_genders):
+            return None
+        mask = 0
+        for bit, symptom in enumerate(symptoms):
+            if symptom not in (0, 1):
+                return None
+            mask |= int(symptom) << bit
+        return int(self.table[int(animal), int(gender), mask,
+                              bisect_right(self._thresholds, age)])
+
+    def predict(self, sample):
+        prediction = self.lookup(sample[ANIMAL], sample[GENDER],
+                                 sample[GENDER + 1:], sample[AGE])
+        if prediction is None:
+            prediction = int(predict_labels(self.forest, [sample])[0])
+        return prediction
+
+    def predict_many(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        n_animals, n_genders = self.table.shape[:2]
+        animal, gender = X[:, ANIMAL], X[:, GENDER]
+        symptoms = X[:, GENDER + 1:]
+        in_table = ((animal >= 0) & (animal < n_animals) & (animal % 1 == 0) &
+                    (gender >= 0) & (gender < n_genders) & (gender % 1 == 0) &
+                    ((symptoms == 0) | (symptoms == 1)).all(axis=1))
+
+        labels = np.empty(len(X), dtype=np.int64)
+        rows = X[in_table]
+        labels[in_table] = self.table[
+            rows[:, ANIMAL].astype(np.intp),
+            rows[:, GENDER].astype(np.intp),
+            rows[:, GENDER + 1:].astype(np.intp) @ self._weights,
+            np.searchsorted(self.age_thresholds, rows[:, AGE], side='right')]
+        if not in_table.all():
+            labels[~in_table] = predict_labels(self.forest, X[~in_table])
+        return labels
+
+
+def _representative_ages(thresholds):
+    # Interval k holds ages in [thresholds[k - 1], thresholds[k]).
+    if len(thresholds) == 0:
+        return np.zeros(1)
+    return np.concatenate(([thresholds[0] - 1.0], thresholds))
+
+
+def _grid(n_animals, n_genders, ages):
+    masks = np.arange(1 << N_SYMPTOMS)
+    animal, gender, mask, age = np.meshgrid(np.arange(n_animals),
+                                            np.arange(n_genders),
+                                            masks, np.arange(len(ages)),
+                                            indexing='ij')
+    X = np.empty(animal.shape + (GENDER + 1 + N_SYMPTOMS,), dtype=np.float64)
+    X[..., ANIMAL] = animal
+    X[..., AGE] = ages[age]
+    X[..., GENDER] = gender
+    for bit in range(N_SYMPTOMS):
+        X[..., GENDER + 1 + bit] = (mask >> bit) & 1
+    return X.reshape(-1, X.shape[-1]), animal.shape
+
+
+def build_table(forest, n_animals, n_genders):
+    start = time.perf_counter()
+    forest = compile_forest(forest)
+    is_split = forest.left != np.arange(forest.n_nodes)
+    thresholds = np.unique(forest.threshold[is_split & (forest.feature == AGE)])
+
+    X, shape = _grid(n_animals, n_genders, _representative_ages(thresholds))
+    dtype = np.int8 if forest.n_classes <= 127 else np.int32
+    table = predict_labels(forest, X).astype(dtype).reshape(shape)
+    return PredictionTable(forest, table, thresholds,
+                           time.perf_counter() - start)
+
+
+def verify_table(prediction_table):
+    # Check every cell against the forest at both edges of each age
+    # interval, which are the only places an off-by-one could hide.
+    thresholds = prediction_table.age_thresholds
+    n_animals, n_genders = prediction_table.table.shape[:2]
+    edges = np.concatenate((np.nextafter(thresholds, -np.inf), thresholds,
+                            [-1e9, 1e9]))
+    X, _ = _grid(n_animals, n_genders, edges)
+    return np.array_equal(prediction_table.predict_many(X),
+                          predict_labels(prediction_table.forest, X))
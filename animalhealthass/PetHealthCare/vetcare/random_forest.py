@@ -1,30 +1,108 @@
-import numpy as np
-from decision_tree import build_tree, predict
-from collections import Counter
-from decision_tree import predict
-
-
-def bagging_predict(trees, row):
-    from decision_tree import predict
-    from collections import Counter
-
-    predictions = [predict(tree, row)
-                   for tree in trees]  # row must be a list of features
-    return Counter(predictions).most_common(1)[0][0]
-
-
-def subsample(dataset, ratio):
-    n_sample = round(len(dataset) * ratio)
-    indices = np.random.choice(len(dataset), n_sample, replace=True)
-    return dataset[indices]
-
-
-# random_forest.py
-def random_forest(train, test, max_depth, min_size, sample_size, n_trees):
-    trees = []
-    for _ in range(n_trees):
-        sample = subsample(train, sample_size)
-        tree = build_tree(sample, max_depth, min_size)
-        trees.append(tree)
-    predictions = [bagging_predict(trees, row) for row in test]
-    return trees  # Return trees instead of predictions
+import os
+import numpy as np
+from multiprocessing import Pool, shared_memory
+from decision_tree import bin_features, build_tree, predict
+from collections import Counter
+from decision_tree import predict
+from flat_forest import FlatForest, predict_labels
+
+
+def bagging_predict(trees, row):
+    from decision_tree import predict
+    from collections import Counter
+
+    if isinstance(trees, FlatForest):
+        return predict_labels(trees, [row])[0]
+    predictions = [predict(tree, row)
+                   for tree in trees]  # row must be a list of features
+    return Counter(predictions).most_common(1)[0][0]
+
+
+def subsample(dataset, ratio, rng=np.random):
+    n_sample = round(len(dataset) * ratio)
+    indices = rng.choice(len(dataset), n_sample, replace=True)
+    return dataset[indices]
+
+
+def _train_tree(train, bins, seed, max_depth, min_size, sample_size, splitter,
+                max_features=None):
+    # The same per-tree generator draws the bootstrap and then the feature
+    # subsets tried at each node.
+    rng = np.random.default_rng(seed)
+    n_sample = round(len(train) * sample_size)
+    indices = rng.choice(len(train), n_sample, replace=True)
+    return build_tree(train, max_depth, min_size, indices, splitter, bins,
+                      max_features, rng)
+
+
+# Worker-side views of the shared arrays, attached once per process.
+_shared = {}
+
+
+def _attach_shared(blocks, edges, files=()):
+    for key, name, shape, dtype in blocks:
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    for key, path in files:
+        _shared[key] = (None, np.load(path, mmap_mode='r'))
+    _shared['edges'] = edges
+
+
+def _train_shared_tree(args):
+    bins = None
+    if 'binned' in _shared:
+        bins = (_shared['binned'][1], _shared['edges'])
+    return _train_tree(_shared['train'][1], bins, *args)
+
+
+def _train_parallel(train, bins, tasks, n_jobs):
+    arrays = {'train': train}
+    if bins is not None:
+        arrays['binned'] = bins[0]
+
+    # A dataset that is already a memory-mapped .npy file (see
+    # dataset_cache.py) is opened by each worker instead of being copied.
+    files = []
+    if isinstance(train, np.memmap) and train.filename:
+        whole = np.load(train.filename, mmap_mode='r')
+        if (whole.shape, whole.dtype, whole.strides) == (train.shape, train.dtype, train.strides):
+            files.append(('train', train.filename))
+            del arrays['train']
+
+    blocks, segments = [], []
+    try:
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            segments.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+            blocks.append((key, shm.name, array.shape, array.dtype))
+        edges = bins[1] if bins is not None else None
+        with Pool(n_jobs, initializer=_attach_shared,
+                  initargs=(blocks, edges, files)) as pool:
+            return pool.map(_train_shared_tree, tasks)
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+
+# random_forest.py
+def random_forest(train, test, max_depth, min_size, sample_size, n_trees,
+                  n_jobs=1, seed=None, splitter='exact', max_features=None):
+    # One independent seed per tree keeps results identical for any n_jobs.
+    seeds = np.random.SeedSequence(seed).spawn(n_trees)
+    tasks = [(tree_seed, max_depth, min_size, sample_size, splitter, max_features)
+             for tree_seed in seeds]
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count()
+    n_jobs = min(n_jobs or 1, n_trees)
+
+    # Histogram mode bins the features once and every tree reuses the bins.
+    bins = bin_features(train[:, :-1]) if splitter == 'hist' else None
+
+    if n_jobs > 1:
+        trees = _train_parallel(train, bins, tasks, n_jobs)
+    else:
+        trees = [_train_tree(train, bins, *task) for task in tasks]
+    return trees  # Return trees instead of predictions
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+
+class _Request:
+    __slots__ = ('table', 'sample', 'enqueued', 'done', 'lead', 'result', 'error')
+
+    def __init__(self, table, sample):
+        self.table = table
+        self.sample = sample
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.lead = False
+        self.result = None
+        self.error = None
+
+
+# Batches single-case predictions from concurrent request threads into one
+# predict_many call. There is no scheduler thread: a request that arrives
+# while no batch is being formed leads one itself, and requests arriving
+# meanwhile queue behind it. When the leader's batch is done, the oldest
+# queued request is woken to lead the next one. A lone request therefore runs
+# straight away in its own thread.
+#
+# Under load the leader waits up to max_wait for more cases, but only while
+# recent batches show concurrent traffic, so the wait never taxes
+# low-traffic latency. A batch holds at most max_batch_size cases.
+class MicroBatcher:
+    ADAPTIVE_THRESHOLD = 1.5
+
+    def __init__(self, max_batch_size=256, max_wait=0.002):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self.max_queue_depth = 0
+        self._avg_batch_size = 1.0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._leading = False
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    @property
+    def window(self):
+        return self.max_wait if self._avg_batch_size >= self.ADAPTIVE_THRESHOLD else 0.0
+
+    def predict(self, table, sample):
+        request = _Request(table, sample)
+        with self._cond:
+            self._pending.append(request)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+            if self._leading:
+                self._cond.notify()
+            else:
+                self._leading = request.lead = True
+        if not request.lead:
+            request.done.wait()
+        if request.lead:
+            self._lead()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'batches': self.batches,
+            'requests': self.requests,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'recent_batch_size': round(self._avg_batch_size, 3),
+            'window_seconds': self.window,
+            'max_wait_seconds': self.max_wait,
+            'max_batch_size': self.max_batch_size,
+        }
+
+    def _lead(self):
+        with self._cond:
+            window = self.window
+            if window:
+                deadline = self._pending[0].enqueued + window
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch = [self._pending.popleft()
+                     for _ in range(min(len(self._pending), self.max_batch_size))]
+            metrics.set_gauge('vetcare_predict_queue_depth', len(self._pending))
+        try:
+            self._run(batch)
+        finally:
+            with self._cond:
+                if self._pending:
+                    successor = self._pending[0]
+                    successor.lead = True
+                    successor.done.set()
+                else:
+                    self._leading = False
+
+    def _run(self, batch):
+        import numpy as np
+
+        started = time.perf_counter()
+        self.batches += 1
+        self.requests += len(batch)
+        self._avg_batch_size = 0.8 * self._avg_batch_size + 0.2 * len(batch)
+        metrics.observe('vetcare_predict_batch_size', len(batch))
+        metrics.observe('vetcare_predict_batch_wait_seconds', started - batch[0].enqueued)
+
+        # A model swap can leave requests for two tables in one batch.
+        groups = {}
+        for request in batch:
+            groups.setdefault(id(request.table), []).append(request)
+        for requests in groups.values():
+            table = requests[0].table
+            try:
+                if len(requests) == 1:
+                    requests[0].result = table.predict(requests[0].sample)
+                else:
+                    labels = table.predict_many(
+                        np.array([request.sample for request in requests], dtype=np.float64))
+                    for request, label in zip(requests, labels.tolist()):
+                        request.result = label
+            except Exception as e:
+                for request in requests:
+                    request.error = e
+            for request in requests:
+                request.done.set()
@@ -0,0 +1,187 @@
+# Hyperparameter search for the random forest.
+#
+#   python tuning.py                      # full grid, 5-fold CV, all cores
+#   python tuning.py --search random --n-iter 20 --report tuning_report.json
+#
+# Every configuration is scored with k-fold cross-validation on a process
+# pool. Workers memory-map the encoded dataset cache (see dataset_cache.py),
+# so they share one read-only copy. The most accurate configuration, or the
+# fastest to predict among those within --tolerance of it, is written to
+# model_config.json, where model_store picks it up for app.py, main.py and
+# retraining.
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from dataset_cache import load_dataset
+from flat_forest import predict_labels
+from forest_optimizer import optimize_trees, pooled_forest
+from model_store import DATASET_PATH, MODEL_CONFIG_PATH, model_params, write_model_config
+from random_forest import bagging_predict, random_forest
+
+PARAM_GRID = {
+    'n_trees': [5, 10, 20, 40],
+    'max_depth': [3, 5, 8],
+    'min_size': [1, 5, 10],
+    'sample_size': [0.5, 0.8, 1.0],
+    'max_features': [None, 'sqrt'],
+}
+LATENCY_ROWS = 200
+
+
+def configurations(grid, search='grid', n_iter=None, seed=None):
+    keys = sorted(grid)
+    configs = [dict(zip(keys, values))
+               for values in itertools.product(*(grid[key] for key in keys))]
+    if search == 'random' and n_iter and n_iter < len(configs):
+        rng = np.random.default_rng(seed)
+        configs = [configs[i] for i in sorted(rng.choice(len(configs), n_iter, replace=False))]
+    return configs
+
+
+def kfold_indices(n_rows, folds, seed=None):
+    order = np.random.default_rng(seed).permutation(n_rows)
+    return np.array_split(order, folds)
+
+
+# The dataset each worker scores against, attached once per process.
+_data = None
+
+
+def _init_worker(path, data=None):
+    global _data
+    _data = np.load(path, mmap_mode='r') if path else data
+
+
+def evaluate(task):
+    params, folds, seed, n_classes = task
+    data = _data
+    accuracies, train_seconds, nodes, model_bytes, latencies = [], [], [], [], []
+    for fold, test_rows in enumerate(folds):
+        train_rows = np.concatenate([rows for i, rows in enumerate(folds) if i != fold])
+        train, test = data[np.sort(train_rows)], data[test_rows]
+
+        start = time.perf_counter()
+        trees = random_forest(train, test[:0], params['max_depth'], params['min_size'],
+                              params['sample_size'], params['n_trees'], seed=seed,
+                              splitter=params['splitter'],
+                              max_features=params['max_features'])
+        train_seconds.append(time.perf_counter() - start)
+
+        # Scored as served: after the optimizer pass model_store applies.
+        trees, pool = optimize_trees(trees)
+        forest = pooled_forest(trees, pool, n_classes)
+        accuracies.append(float(np.mean(predict_labels(forest, test[:, :-1]) == test[:, -1])))
+        nodes.append(forest.n_nodes)
+        model_bytes.append(sum(getattr(forest, name).nbytes for name in
+                               ('feature', 'threshold', 'left', 'right', 'leaf_class', 'roots')))
+
+        # Per-row latency of the reference predictor, as the original
+        # serving path called it.
+        for row in test[:LATENCY_ROWS, :-1]:
+            row = row.tolist()
+            start = time.perf_counter()
+            bagging_predict(trees, row)
+            latencies.append(time.perf_counter() - start)
+
+    return {
+        'params': params,
+        'accuracy': float(np.mean(accuracies)),
+        'accuracy_std': float(np.std(accuracies)),
+        'train_seconds': float(np.mean(train_seconds)),
+        'nodes': int(np.mean(nodes)),
+        'model_bytes': int(np.mean(model_bytes)),
+        'predict_p50_us': float(np.percentile(latencies, 50) * 1e6),
+        'predict_p99_us': float(np.percentile(latencies, 99) * 1e6),
+    }
+
+
+def search(data, configs, n_classes, folds=5, n_jobs=None, seed=0):
+    folds = kfold_indices(len(data), folds, seed)
+    tasks = [(params, folds, seed, n_classes) for params in configs]
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(tasks))
+    path = data.filename if isinstance(data, np.memmap) else None
+    initargs = (path, None if path else data)
+    if n_jobs == 1:
+        _init_worker(*initargs)
+        return [evaluate(task) for task in tasks]
+    with Pool(n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+        return pool.map(evaluate, tasks, chunksize=1)
+
+
+def choose(results, tolerance=0.0):
+    # Highest mean accuracy; among configurations within tolerance of it,
+    # the one with the lowest median prediction latency.
+    best = max(result['accuracy'] for result in results)
+    candidates = [r for r in results if r['accuracy'] >= best - tolerance]
+    return min(candidates, key=lambda r: (r['predict_p50_us'], r['train_seconds']))
+
+
+def format_table(results):
+    lines = [f"{'accuracy':>9} {'std':>6} {'train_s':>8} {'nodes':>6} "
+             f"{'bytes':>8} {'p50_us':>8} {'p99_us':>8}  params"]
+    for r in sorted(results, key=lambda r: -r['accuracy']):
+        params = ' '.join(f"{key}={value}" for key, value in sorted(r['params'].items())
+                          if key != 'splitter')
+        lines.append(f"{r['accuracy']:9.4f} {r['accuracy_std']:6.3f} "
+                     f"{r['train_seconds']:8.3f} {r['nodes']:6d} {r['model_bytes']:8d} "
+                     f"{r['predict_p50_us']:8.1f} {r['predict_p99_us']:8.1f}  {params}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune the random forest hyperparameters.')
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--search', choices=('grid', 'random'), default='grid')
+    parser.add_argument('--n-iter', type=int, default=20,
+                        help='configurations to sample with --search random')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.005,
+                        help='accuracy given up for a faster model')
+    parser.add_argument('--report', help='write every result as JSON here')
+    parser.add_argument('--config', default=MODEL_CONFIG_PATH,
+                        help='where to write the chosen configuration')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report only, do not write the configuration')
+    args = parser.parse_args(argv)
+
+    base = model_params()
+    data, classes = load_dataset(args.dataset, use_reservoir=base['use_reservoir'])
+    configs = [dict(base, **config) for config in
+               configurations(PARAM_GRID, args.search, args.n_iter, args.seed)]
+    print(f"Scoring {len(configs)} configurations with {args.folds}-fold CV ...",
+          file=sys.stderr)
+    start = time.perf_counter()
+    results = search(data, configs, len(classes['Disease']), args.folds, args.jobs,
+                     args.seed)
+    elapsed = time.perf_counter() - start
+
+    chosen = choose(results, args.tolerance)
+    print(format_table(results))
+    print(f"\nChosen: {json.dumps(chosen['params'])} "
+          f"(accuracy {chosen['accuracy']:.4f}, p50 {chosen['predict_p50_us']:.1f} us) "
+          f"in {elapsed:.1f}s")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'folds': args.folds, 'seed': args.seed, 'search': args.search,
+                       'chosen': chosen, 'results': results}, f, indent=2)
+    if not args.dry_run:
+        write_model_config(chosen['params'], args.config,
+                           accuracy=chosen['accuracy'], folds=args.folds,
+                           tuned_at=time.time())
+        print(f"Wrote {args.config}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())